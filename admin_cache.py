@@ -0,0 +1,69 @@
+import time
+import asyncio
+import logging
+
+from aiogram import Bot
+from aiogram.types import ChatMemberUpdated
+
+import config
+
+
+logger = logging.getLogger(__name__)
+
+ADMIN_STATUSES = ("creator", "administrator")
+
+
+class AdminCache:
+    """
+    Кэш администраторов чатов: заполняется одним запросом get_chat_administrators,
+    обновляется событиями chat_member и на всякий случай устаревает по TTL
+    """
+
+    def __init__(self, ttl: float):
+        """
+        Args:
+            ttl: через сколько секунд список администраторов чата запрашивается заново
+        """
+        self.ttl = ttl
+        self._admins = {}    # chat_id -> множество user_id администраторов
+        self._expires = {}   # chat_id -> время устаревания (monotonic)
+        self._locks = {}
+
+    async def is_admin(self, bot: Bot, chat_id: int, user_id: int) -> bool:
+        admins = self._admins.get(chat_id)
+        if admins is None or self._expires[chat_id] < time.monotonic():
+            admins = await self._warm(bot, chat_id)
+        return user_id in admins
+
+    async def _warm(self, bot: Bot, chat_id: int) -> set:
+        # Одновременные команды в одном чате ждут один и тот же запрос к API
+        lock = self._locks.setdefault(chat_id, asyncio.Lock())
+        async with lock:
+            if chat_id in self._admins and self._expires[chat_id] >= time.monotonic():
+                return self._admins[chat_id]
+
+            members = await bot.get_chat_administrators(chat_id)
+            admins = {member.user.id for member in members if member.status in ADMIN_STATUSES}
+            self._admins[chat_id] = admins
+            self._expires[chat_id] = time.monotonic() + self.ttl
+            logger.info(f"Загружены администраторы чата {chat_id}: {len(admins)}")
+            return admins
+
+    # Обновление по событию chat_member (повышение/понижение/выход участника)
+    def on_chat_member(self, event: ChatMemberUpdated):
+        admins = self._admins.get(event.chat.id)
+        if admins is None:
+            return
+
+        user_id = event.new_chat_member.user.id
+        if event.new_chat_member.status in ADMIN_STATUSES:
+            admins.add(user_id)
+        else:
+            admins.discard(user_id)
+
+    def forget(self, chat_id: int):
+        self._admins.pop(chat_id, None)
+        self._expires.pop(chat_id, None)
+
+
+admin_cache = AdminCache(ttl=config.ADMIN_CACHE_TTL)
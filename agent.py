@@ -1,30 +1,82 @@
+import os
+import time
+import uuid
+import hashlib
+import threading
 from gigachat import GigaChat
 from gigachat.models import Chat, Messages, MessagesRole
 import config
 import document_loader
+import metrics
+import usage
+from faq_index import FaqIndex
+from gigachat_session import SessionGigaChat
+from session_store import SessionStore
 
 
 _lecture_text = ""
 _gigachat_client = None
-_chat_history = []  
+_system_message = None
+_prompt_prefix = ()   # неизменяемый общий префикс каждого запроса: системное сообщение с лекцией
+_prompt_hash = ""
+_chat_histories = {}  # chat_id -> история диалога чата (без системного сообщения)
+_session_store = None
+_histories_lock = threading.Lock()   # ask_agent работает в потоках: загрузка и правка историй
+_faq_index = FaqIndex()
+_lecture_mtime = None   # версия файла лекции, загруженная в промпт
+_lecture_checked = 0.0
+_agent_lock = threading.Lock()   # замена клиента и промпта (перезагрузка) против чтения их в ask_agent
+
+# Хранилище истории открываем один раз; истории чатов с диска не читаем до первого вопроса
+def _get_store():
+    global _session_store
+    if _session_store is None:
+        _session_store = SessionStore(
+            config.SESSION_DB_PATH,
+            history_limit=config.CHAT_HISTORY_LIMIT,
+            flush_interval=config.SESSION_FLUSH_INTERVAL,
+            compact_interval=config.SESSION_COMPACT_INTERVAL,
+        )
+    return _session_store
+
+# История чата: из памяти, а после перезапуска - лениво с диска
+def _get_history(chat_id: int) -> list:
+    history = _chat_histories.get(chat_id)
+    if history is not None:
+        return history
+    with _histories_lock:
+        history = _chat_histories.get(chat_id)
+        if history is None:
+            history = [Messages(role=role, content=content) for role, content in _get_store().load(chat_id)]
+            if history:
+                print(f"История чата {chat_id} восстановлена с диска: {len(history)} сообщений")
+            _chat_histories[chat_id] = history
+    return history
+
+# Идентификатор сессии GigaChat для чата: постоянный, пока не поменялась лекция,
+# чтобы запросы чата попадали туда, где префикс промпта уже обработан
+def _session_id(chat_id: int):
+    if not config.GIGACHAT_PREFIX_CACHE:
+        return None
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"giga-assistant/{_prompt_hash}/{chat_id}"))
 
 # Инициализирует агента: загружает документ и создаёт сессию GigaChat
 def init_agent():
-    global _lecture_text, _gigachat_client, _chat_history
+    global _lecture_text, _gigachat_client, _system_message, _prompt_prefix, _prompt_hash, _lecture_mtime
     
     print(f"Загружаем документ: {config.LECTURE_DOCUMENT_PATH}")
     try:
+        lecture_mtime = os.stat(config.LECTURE_DOCUMENT_PATH).st_mtime
         _lecture_text = document_loader.load_document(config.LECTURE_DOCUMENT_PATH)
         print(f"Документ загружен. Длина текста: {len(_lecture_text)} символов")
         
         # Создаём клиента GigaChat
-        _gigachat_client = GigaChat(credentials=config.GIGACHAT_API_KEY, verify_ssl_certs=False)
+        _gigachat_client = SessionGigaChat(credentials=config.GIGACHAT_API_KEY, verify_ssl_certs=False)
         
         # Отправляем лекцию как системное сообщение 
-        _chat_history = [
-            Messages(
-                role=MessagesRole.SYSTEM, 
-                content=f"""Ты - ассистент спикера на лекции. Твоя задача - отвечать на вопросы слушателей, используя ТОЛЬКО информацию из текста лекции ниже.
+        _system_message = Messages(
+            role=MessagesRole.SYSTEM, 
+            content=f"""Ты - ассистент спикера на лекции. Твоя задача - отвечать на вопросы слушателей, используя ТОЛЬКО информацию из текста лекции ниже.
 
 ТЕКСТ ЛЕКЦИИ:
 ----------------------------------------
@@ -38,9 +90,23 @@ def init_agent():
 4. Отвечай на том языке, на котором задан вопрос
 5. Если тебя попросят придумать вопросы для спикера, то сделай это креативно
 6. Не используй двойные звездочки (**) для выделения цвета жирным"""
+        )
+        
+        # Системное сообщение собираем один раз и переиспользуем во всех запросах всех чатов
+        _prompt_prefix = (_system_message,)
+        _prompt_hash = hashlib.sha256(_system_message.content.encode("utf-8")).hexdigest()[:16]
+        
+        _get_store()
+        
+        # Частые вопросы готовим в фоне отдельным клиентом; индекс привязан к хэшу промпта с лекцией
+        if config.FAQ_ENABLED:
+            faq_client = usage.MeteredClient(
+                GigaChat(credentials=config.GIGACHAT_API_KEY, verify_ssl_certs=False),
+                usage.tracker, command="faq"
             )
-        ]
+            _faq_index.start(faq_client, _lecture_text, _prompt_hash, build=config.FAQ_BUILD)
         
+        _lecture_mtime = lecture_mtime
         print("Агент инициализирован, лекция загружена в системный промпт")
         return True
         
@@ -48,34 +114,106 @@ def init_agent():
         print(f"ОШИБКА инициализации агента: {e}")
         return False
 
-# задаем вопрос агенту и получаем ответ
-def ask_agent(question: str) -> str:
-    global _gigachat_client, _chat_history
+# Закрываем старого клиента перед созданием нового
+def _close_client():
+    if _gigachat_client:
+        try:
+            _gigachat_client.close()
+        except:
+            pass
+
+# Файл лекции поменяли на диске - заново собираем промпт и FAQ индекс (истории чатов сохраняем)
+def _reload_if_lecture_changed():
+    global _lecture_checked, _lecture_mtime
+    if time.monotonic() - _lecture_checked < config.FAQ_CHECK_INTERVAL:
+        return
+    with _agent_lock:
+        # Пока ждали замок, файл мог проверить другой поток
+        now = time.monotonic()
+        if now - _lecture_checked < config.FAQ_CHECK_INTERVAL:
+            return
+        _lecture_checked = now
+        try:
+            mtime = os.stat(config.LECTURE_DOCUMENT_PATH).st_mtime
+        except OSError:
+            return
+        if mtime == _lecture_mtime:
+            return
+        # Один раз на изменение: если файл ещё дописывается и загрузка упадёт, ждём следующей правки
+        _lecture_mtime = mtime
+        print("Файл лекции изменился - загружаем заново")
+        _close_client()
+        init_agent()
+
+# Добавляем вопрос и ответ в историю (чтобы модель помнила контекст), на диск пишем в фоне
+def _remember(chat_id: int, history: list, user_message: Messages, assistant_answer: str):
+    assistant_message = Messages(role=MessagesRole.ASSISTANT, content=assistant_answer)
+    with _histories_lock:
+        history.extend((user_message, assistant_message))
+        del history[:max(0, len(history) - config.CHAT_HISTORY_LIMIT)]
     
-    # Проверяем, инициализирован ли агент
-    if not _gigachat_client or not _chat_history:
-        return "❌ Ошибка: агент не инициализирован. Обратитесь к администратору."
+    store = _get_store()
+    store.append(chat_id, MessagesRole.USER.value, user_message.content)
+    store.append(chat_id, MessagesRole.ASSISTANT.value, assistant_answer)
     
+    print(f"История диалога чата {chat_id}: {len(history)} сообщений")
+
+# задаем вопрос агенту и получаем ответ
+def ask_agent(question: str, chat_id: int = 0, user_id: int = 0, command: str = "ask") -> str:
     if not question or not question.strip():
         return "Пожалуйста, задайте вопрос."
     
+    _reload_if_lecture_changed()
+    
+    # Клиент, промпт и сессия - из одной версии лекции, даже если её сейчас перезагружают
+    with _agent_lock:
+        client, prompt_prefix, session_id = _gigachat_client, _prompt_prefix, _session_id(chat_id)
+    
+    # Проверяем, инициализирован ли агент
+    if not client or not prompt_prefix:
+        return "❌ Ошибка: агент не инициализирован. Обратитесь к администратору."
+    
     try:
-        # Добавляем вопрос пользователя в историю
+        history = _get_history(chat_id)
+        
+        # Добавляем вопрос пользователя к истории чата
         user_message = Messages(role=MessagesRole.USER, content=question)
-        _chat_history.append(user_message)
         
-        # Отправляем всю историю в GigaChat
-        response = _gigachat_client.chat(Chat(messages=_chat_history))
+        # Типичный вопрос - отвечаем из заранее подготовленного индекса без запроса к GigaChat
+        hit = _faq_index.lookup(question) if config.FAQ_ENABLED else None
+        if hit is not None:
+            entry, score = hit
+            print(f"Ответ из FAQ (близость {score:.2f}): {entry['question']}")
+            metrics.inc("faq_hits_total")
+            _remember(chat_id, history, user_message, entry["answer"])
+            return entry["answer"]
+        
+        # Оцениваем размер запроса заранее и выбираем режим по суточной квоте
+        messages = [*prompt_prefix, *history, user_message]
+        estimated = usage.tracker.estimate(messages)
+        mode = usage.tracker.mode(chat_id, user_id, estimated)
+        
+        chat = Chat(messages=messages)
+        if mode != usage.NORMAL:
+            # Экономный режим: только последние реплики истории и короткий ответ
+            keep = config.ECONOMY_HISTORY_MESSAGES // 2 * 2
+            chat = Chat(messages=[*prompt_prefix, *(history[-keep:] if keep else []), user_message],
+                        max_tokens=config.ECONOMY_MAX_TOKENS)
+            estimated = usage.tracker.estimate(chat.messages)
+            # Отказываем, только если в квоту не влезает и сокращённый запрос
+            if usage.tracker.mode(chat_id, user_id, estimated) == usage.EXHAUSTED:
+                return "⏳ Дневной лимит запросов исчерпан. Попробуйте завтра."
+            metrics.inc("economy_answers_total")
+        
+        # Отправляем общий префикс и историю чата в GigaChat (в сессии чата префикс кэшируется)
+        with metrics.timer("llm_chat"):
+            response = client.chat(chat, session_id=session_id)
+        usage.tracker.record(chat_id, user_id, command, response.usage, estimated)
         
         # Получаем ответ ассистента
         assistant_answer = response.choices[0].message.content
         
-        # Добавляем ответ ассистента в историю (чтобы модель помнила контекст)
-        assistant_message = Messages(role=MessagesRole.ASSISTANT, content=assistant_answer)
-        _chat_history.append(assistant_message)
-        
-
-        print(f"История диалога: {len(_chat_history)} сообщений")
+        _remember(chat_id, history, user_message, assistant_answer)
         
         return assistant_answer
             
@@ -83,16 +221,30 @@ def ask_agent(question: str) -> str:
         print(f"Ошибка при запросе к GigaChat: {e}")
         return "❌ Произошла ошибка при обращении к GigaChat. Попробуйте позже."
 
+# сброс истории одного чата
+def reset_history(chat_id: int):
+    _chat_histories[chat_id] = []
+    _get_store().clear(chat_id)
+
 # перезагрузка - сбрасываем историю и заново загружаем бота
 def reload_agent():
-    global _gigachat_client, _chat_history
-    
-    # Закрываем старого клиента
-    if _gigachat_client:
-        try:
-            _gigachat_client.close()
-        except:
-            pass
-    
-    # Заново инициализируем
-    return init_agent()
\ No newline at end of file
+    with _agent_lock:
+        _close_client()
+        
+        # Сбрасываем истории всех чатов (пока очистка не записана, load() не вернёт старую историю)
+        _get_store().clear()
+        _chat_histories.clear()
+        
+        # Заново инициализируем
+        return init_agent()
+
+# ждём, пока FAQ индекс загрузится или соберётся (нужно фронту кластера перед запуском воркеров)
+def wait_faq_index(timeout: float = None) -> bool:
+    return _faq_index.wait(timeout)
+
+# остановка - дописываем отложенную историю на диск
+def shutdown_agent():
+    global _session_store
+    if _session_store is not None:
+        _session_store.close()
+        _session_store = None
@@ -0,0 +1,95 @@
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from common import ROOT, BackgroundServer, latency_summary
+from fake_gigachat import FakeGigaChat
+from synthetic_updates import MENTION_QUESTIONS
+
+
+# Сравнение ask_agent с сессиями GigaChat (X-Session-ID) и без них на заглушке,
+# которая тратит prompt_latency на каждый заново обработанный токен входа.
+# Запуск: python benchmarks/bench_prefix_cache.py --chats 5 --questions 40
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Эффект переиспользования префикса промпта")
+    parser.add_argument("--chats", type=int, default=5)
+    parser.add_argument("--questions", type=int, default=40, help="вопросов на каждый режим")
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка на запрос, с")
+    parser.add_argument("--prompt-latency", type=float, default=0.00005, help="задержка на токен входа, с")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def run(agent, fake: FakeGigaChat, args, prefix_cache: bool) -> dict:
+    import config
+
+    config.GIGACHAT_PREFIX_CACHE = prefix_cache
+    agent.reload_agent()
+    for key in ("prompt_tokens", "processed_prompt_tokens", "cached_prompt_tokens"):
+        fake.stats[key] = 0
+
+    rng = random.Random(args.seed)
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(args.questions):
+        chat_id = -(10 ** 12) - rng.randrange(args.chats)
+        begin = time.perf_counter()
+        agent.ask_agent(rng.choice(MENTION_QUESTIONS), chat_id)
+        latencies.append(time.perf_counter() - begin)
+    summary = latency_summary(latencies, time.perf_counter() - started)
+    summary.update({key: fake.stats[key] for key in
+                    ("prompt_tokens", "processed_prompt_tokens", "cached_prompt_tokens")})
+    return summary
+
+
+def main():
+    args = parse_args()
+
+    fake = FakeGigaChat(base_latency=args.latency, prompt_latency=args.prompt_latency, token_latency=0)
+    server = BackgroundServer(fake.app()).start()
+
+    workdir = Path(tempfile.mkdtemp(prefix="giga_prefix_"))
+    os.environ.update({
+        "GIGACHAT_API_KEY": "bench",
+        "GIGACHAT_SUMMARIZATION_API_KEY": "bench",
+        "TELEGRAM_BOT_TOKEN": "123456:BENCH",
+        "GIGACHAT_BASE_URL": server.base_url,
+        "GIGACHAT_AUTH_URL": f"{server.base_url}/oauth",
+        "SESSION_DB_PATH": str(workdir / "sessions.db"),
+        "USAGE_DB_PATH": str(workdir / "usage.db"),
+        # Ответы из FAQ обходят GigaChat и исказили бы сравнение
+        "FAQ_ENABLED": "0",
+    })
+
+    # Импорт после настройки окружения: config читает переменные при импорте
+    import agent
+
+    try:
+        os.chdir(ROOT)
+        if not agent.init_agent():
+            print("Не удалось инициализировать агента")
+            sys.exit(2)
+
+        results = {"без сессий": run(agent, fake, args, False), "с сессиями": run(agent, fake, args, True)}
+    finally:
+        agent.shutdown_agent()
+        server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{'режим':12s} {'p50':>8s} {'p95':>8s} {'токенов входа':>14s} {'обработано':>11s} {'из кэша':>9s}")
+    for mode, values in results.items():
+        print(f"{mode:12s} {values['p50']:8.3f} {values['p95']:8.3f} {values['prompt_tokens']:14d} "
+              f"{values['processed_prompt_tokens']:11d} {values['cached_prompt_tokens']:9d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import os
+import sys
+import random
+import timeit
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wake_word import WakeWordMatcher, DEFAULT_NAMES
+
+
+# Микробенчмарк поиска обращений: прежняя проверка из bot.py против WakeWordMatcher
+# Запуск: python benchmarks/bench_wake_word.py --messages 100000
+
+NAMES = DEFAULT_NAMES + ["@Giga_AssistantBot"]
+
+CHATTER = [
+    "Коллеги, кто-нибудь записывает презентацию?",
+    "Отличный доклад, спасибо!",
+    "А слайды потом пришлют?",
+    "Согласен с предыдущим оратором",
+    "Где будет кофе-брейк?",
+    "+1",
+    "Интересно, как это применить у нас в отделе",
+    "Гигантский зал, ничего не слышно сзади",
+    "Мне кажется, самое важное в докладе - это мысль о том, что правила должны быть простыми "
+    "и понятными каждому сотруднику, иначе их никто не будет соблюдать, сколько бы их ни вводили",
+]
+MENTIONS = [
+    "Гигачат, какой основной вывод лекции?",
+    "giga какие три правила ввел спикер?",
+    "@Giga_AssistantBot что говорили про безопасность?",
+    "Ассистент, повтори ключевые тезисы",
+]
+# Так Whisper иногда записывает обращение
+STT_VARIANTS = [
+    "Гигачад, какой основной вывод лекции?",
+    "Giga chat, какие правила ввел спикер?",
+    "Гига чат что говорили про безопасность?",
+    "Гигачат. Как применить идею на практике?",
+    "Асистент, повтори ключевые тезисы",
+]
+# Похожие слова, которые обращением не являются
+NOT_MENTIONS = [
+    "Ассистенты сказали, что слайды пришлют",
+    "Ассистентка спикера раздаёт материалы",
+    "Гигачату такое не понравится",
+]
+
+
+# Прежняя реализация is_bot_mentioned из bot.py (без логирования)
+def legacy_is_bot_mentioned(text: str) -> bool:
+    if not text or not text.strip():
+        return False
+
+    first_word = text.strip().split()[0].lower().strip('.,!?;:')
+
+    if first_word in NAMES:
+        return True
+
+    if first_word.startswith('@') and first_word[1:].lower() in [name.lower().replace('@', '') for name in NAMES]:
+        return True
+
+    return False
+
+
+# Прежняя обработка в handle_text: проверка обращения и выделение вопроса (как и match())
+def legacy_extract_question(text: str):
+    if not legacy_is_bot_mentioned(text):
+        return None
+
+    words = text.strip().split()
+    if len(words) > 1:
+        return ' '.join(words[1:]).lstrip(', ')
+    return ""
+
+
+def build_corpus(size: int, mention_share: float, seed: int) -> list:
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(size):
+        if rng.random() < mention_share:
+            corpus.append(rng.choice(MENTIONS + STT_VARIANTS))
+        else:
+            corpus.append(rng.choice(CHATTER))
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Микробенчмарк поиска обращений к боту")
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--mention-share", type=float, default=0.1, help="доля сообщений с обращением")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.messages, args.mention_share, args.seed)
+    matcher = WakeWordMatcher(NAMES)
+
+    cases = {
+        "legacy": lambda: [legacy_extract_question(text) for text in corpus],
+        "matcher": lambda: [matcher.match(text) for text in corpus],
+        "matcher_fuzzy": lambda: [matcher.match(text, fuzzy=True) for text in corpus],
+    }
+
+    print(f"Сообщений: {len(corpus)}, доля обращений: {args.mention_share}")
+    for name, case in cases.items():
+        best = min(timeit.repeat(case, number=1, repeat=args.repeat))
+        found = sum(1 for result in case() if result is not None and result is not False)
+        print(f"{name:15s} {best * 1e9 / len(corpus):8.0f} нс/сообщение   найдено обращений: {found}")
+
+    print("\nВарианты из распознанной речи:")
+    for text in STT_VARIANTS:
+        match = matcher.match(text, fuzzy=True)
+        legacy = legacy_is_bot_mentioned(text)
+        print(f"  {text[:40]:40s} legacy={legacy!s:5s} matcher={match.name if match else None}")
+
+    print("\nНе обращения:")
+    for text in NOT_MENTIONS:
+        match = matcher.match(text, fuzzy=True)
+        print(f"  {text[:40]:40s} matcher={match.name if match else None}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+import subprocess
+from pathlib import Path
+
+from aiohttp import web
+
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def latency_summary(latencies: list, elapsed: float) -> dict:
+    return {
+        "count": len(latencies),
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "max": max(latencies, default=0.0),
+    }
+
+
+# Текущий и пиковый RSS процесса, МБ
+def rss_mb() -> tuple:
+    current = 0.0
+    try:
+        with open("/proc/self/statm") as f:
+            current = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        pass
+
+    peak = 0.0
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux отдаёт КБ, macOS - байты
+        peak = peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        pass
+    return current, peak
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, timeout=5).stdout.strip()
+    except Exception:
+        return ""
+
+
+def save_results(results: dict, name: str = None) -> Path:
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    path = RESULTS_DIR / f"{name or time.strftime('%Y%m%d-%H%M%S')}.json"
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    return path
+
+
+class BackgroundServer:
+    """
+    aiohttp приложение в отдельном потоке со своим event loop.
+    Заглушки не делят event loop с ботом, поэтому их задержки не искажают замеры,
+    а синхронный клиент GigaChat можно вызывать и из основного потока (bench_prefix_cache.py).
+    """
+
+    def __init__(self, app: web.Application, host: str = "127.0.0.1", port: int = 0):
+        self.app = app
+        self.host = host
+        self.port = port
+        self._loop = asyncio.new_event_loop()
+        self._runner = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._start())
+        self._ready.set()
+        self._loop.run_forever()
+
+    async def _start(self):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        # При port=0 порт выбирает система
+        self.port = self._runner.addresses[0][1]
+
+    def start(self) -> "BackgroundServer":
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        future = asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop)
+        future.result(timeout=10)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=10)
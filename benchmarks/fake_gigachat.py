@@ -0,0 +1,163 @@
+import sys
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import argparse
+
+from aiohttp import web
+
+
+# Локальная заглушка GigaChat API: OAuth, /models и /chat/completions (обычный и потоковый ответ)
+# Клиент gigachat направляется сюда переменными окружения GIGACHAT_BASE_URL и GIGACHAT_AUTH_URL
+
+
+FAQ = [
+    ("Какой основной вывод лекции?", ["Какой главный вывод?", "В чём основная мысль выступления?"],
+     "Главный вывод: правила внутри компании должны быть простыми и понятными каждому."),
+    ("Какие три новых правила ввел спикер?", ["Какие правила предложил спикер?", "Что за три правила?"],
+     "Спикер ввёл три правила: открытость, ответственность и простота."),
+]
+
+
+def estimate_tokens(text: str) -> int:
+    # Грубая оценка: ~4 символа на токен
+    return max(1, len(text) // 4)
+
+
+class FakeGigaChat:
+    """
+    Заглушка GigaChat с настраиваемой задержкой: base_latency на запрос,
+    prompt_latency на токен входа и token_latency на токен ответа.
+    Запросы с заголовком X-Session-ID не платят за префикс, совпавший с прошлым запросом сессии.
+    """
+
+    def __init__(self, base_latency: float = 0.3, prompt_latency: float = 0.0,
+                 token_latency: float = 0.005, answer_tokens: int = 60):
+        self.base_latency = base_latency
+        self.prompt_latency = prompt_latency
+        self.token_latency = token_latency
+        self.answer_tokens = answer_tokens
+        self.stats = {"auth": 0, "chat": 0, "stream": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                      "processed_prompt_tokens": 0, "cached_prompt_tokens": 0}
+        # session_id -> [(хэш сообщения, токены)] прошлого запроса вместе с ответом
+        self._sessions = {}
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 2 ** 20)
+        app.router.add_post("/oauth", self.handle_auth)
+        app.router.add_get("/models", self.handle_models)
+        app.router.add_post("/chat/completions", self.handle_chat)
+        return app
+
+    async def handle_auth(self, request: web.Request) -> web.Response:
+        self.stats["auth"] += 1
+        return web.json_response({
+            "access_token": uuid.uuid4().hex,
+            "expires_at": int((time.time() + 1800) * 1000),
+        })
+
+    async def handle_models(self, request: web.Request) -> web.Response:
+        return web.json_response({"object": "list", "data": [
+            {"id": "GigaChat", "object": "model", "owned_by": "fake"},
+        ]})
+
+    def _answer(self, messages: list) -> str:
+        # Запрос на сборку FAQ индекса (faq_index.py) - отвечаем в ожидаемом формате
+        if messages and "ВАРИАНТЫ:" in messages[0]["content"]:
+            return "\n".join(f"ВОПРОС: {question}\nВАРИАНТЫ: {' | '.join(variants)}\nОТВЕТ: {answer}"
+                             for question, variants, answer in FAQ)
+        question = messages[-1]["content"] if messages else ""
+        words = ["ответ"] * self.answer_tokens
+        return f"по вопросу «{question[:50]}» спикер говорил следующее: " + " ".join(words)
+
+    @staticmethod
+    def _message_key(message: dict) -> tuple:
+        digest = hashlib.sha1(f"{message.get('role')}:{message.get('content')}".encode("utf-8")).digest()
+        return digest, estimate_tokens(message.get("content") or "")
+
+    # Сколько токенов входа всего и сколько модель обрабатывает заново:
+    # в сессии переиспользуется самый длинный общий префикс с прошлым запросом
+    def processed_prompt_tokens(self, request: web.Request, messages: list) -> tuple:
+        keys = [self._message_key(message) for message in messages]
+        prompt_tokens = sum(tokens for _, tokens in keys)
+
+        cached_tokens = 0
+        session_id = request.headers.get("X-Session-ID")
+        if session_id:
+            for current, previous in zip(keys, self._sessions.get(session_id, ())):
+                if current[0] != previous[0]:
+                    break
+                cached_tokens += current[1]
+        return prompt_tokens, prompt_tokens - cached_tokens
+
+    def remember(self, request: web.Request, messages: list, answer: str):
+        session_id = request.headers.get("X-Session-ID")
+        if session_id:
+            self._sessions[session_id] = [self._message_key(message) for message in messages] + \
+                                         [self._message_key({"role": "assistant", "content": answer})]
+
+    async def handle_chat(self, request: web.Request) -> web.StreamResponse:
+        payload = await request.json()
+        messages = payload.get("messages", [])
+        prompt_tokens, processed_tokens = self.processed_prompt_tokens(request, messages)
+        answer = self._answer(messages)
+        completion_tokens = estimate_tokens(answer)
+        self.remember(request, messages, answer)
+
+        self.stats["prompt_tokens"] += prompt_tokens
+        self.stats["processed_prompt_tokens"] += processed_tokens
+        self.stats["cached_prompt_tokens"] += prompt_tokens - processed_tokens
+        self.stats["completion_tokens"] += completion_tokens
+
+        await asyncio.sleep(self.base_latency + processed_tokens * self.prompt_latency)
+
+        model = payload.get("model") or "GigaChat"
+        if payload.get("stream"):
+            self.stats["stream"] += 1
+            return await self._stream(request, model, answer)
+
+        self.stats["chat"] += 1
+        await asyncio.sleep(completion_tokens * self.token_latency)
+        return web.json_response({
+            "choices": [{"message": {"role": "assistant", "content": answer}, "index": 0,
+                         "finish_reason": "stop"}],
+            "created": int(time.time()),
+            "model": model,
+            "object": "chat.completion",
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens,
+                      "precached_prompt_tokens": prompt_tokens - processed_tokens},
+        })
+
+    async def _stream(self, request: web.Request, model: str, answer: str) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for word in answer.split(" "):
+            await asyncio.sleep(self.token_latency)
+            chunk = {"choices": [{"delta": {"content": word + " "}, "index": 0}],
+                     "created": int(time.time()), "model": model, "object": "chat.completion"}
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальная заглушка GigaChat API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--latency", type=float, default=0.3, help="задержка на запрос, с")
+    parser.add_argument("--prompt-latency", type=float, default=0.0, help="задержка на токен входа, с")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="задержка на токен ответа, с")
+    args = parser.parse_args()
+
+    fake = FakeGigaChat(args.latency, args.prompt_latency, args.token_latency)
+    print(f"GIGACHAT_BASE_URL=http://{args.host}:{args.port} "
+          f"GIGACHAT_AUTH_URL=http://{args.host}:{args.port}/oauth", file=sys.stderr)
+    web.run_app(fake.app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
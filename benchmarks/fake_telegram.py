@@ -0,0 +1,99 @@
+import time
+import asyncio
+import argparse
+import itertools
+
+from aiohttp import web
+
+
+# Локальная заглушка Bot API: принимает те же вызовы, что делает bot.py
+# Бот направляется сюда через TELEGRAM_API_BASE_URL
+
+
+class FakeBotAPI:
+    """
+    Заглушка Bot API с настраиваемой задержкой ответа.
+    Считает вызовы по методам и отдаёт голосовые файлы из voice_files.
+    """
+
+    def __init__(self, latency: float = 0.02, bot_id: int = 1000):
+        self.latency = latency
+        self.bot_id = bot_id
+        self.calls = {}
+        self.voice_files = {}   # file_id -> байты аудио
+        self._message_ids = itertools.count(10 ** 6)
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 2 ** 20)
+        app.router.add_post("/bot{token}/{method}", self.handle_method)
+        app.router.add_get("/file/bot{token}/{path:.+}", self.handle_file)
+        return app
+
+    def _message(self, chat_id, text: str = None) -> dict:
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private" if int(chat_id) > 0 else "supergroup"},
+            "from": {"id": self.bot_id, "is_bot": True, "first_name": "Giga"},
+        }
+        if text is not None:
+            message["text"] = text
+        return message
+
+    def _admins(self, chat_id) -> list:
+        return [{"status": "creator", "user": {"id": 1, "is_bot": False, "first_name": "Admin"}}]
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        data = await request.post()
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        chat_id = data.get("chat_id", 0)
+        if method == "getMe":
+            result = {"id": self.bot_id, "is_bot": True, "first_name": "Giga", "username": "Giga_AssistantBot"}
+        elif method in ("sendMessage", "editMessageText"):
+            result = self._message(chat_id, data.get("text", ""))
+            if "message_id" in data:
+                result["message_id"] = int(data["message_id"])
+        elif method == "sendDocument":
+            result = self._message(chat_id)
+            result["document"] = {"file_id": "doc", "file_unique_id": "doc"}
+        elif method == "getFile":
+            file_id = data.get("file_id", "")
+            result = {"file_id": file_id, "file_unique_id": file_id, "file_path": f"voice/{file_id}.wav"}
+        elif method == "getChatAdministrators":
+            result = self._admins(chat_id)
+        elif method == "getChatMember":
+            result = {"status": "member", "user": {"id": int(data.get("user_id", 0)), "is_bot": False,
+                                                   "first_name": "User"}}
+        else:
+            # sendChatAction, deleteMessage, deleteWebhook, setWebhook ...
+            result = True
+
+        return web.json_response({"ok": True, "result": result})
+
+    async def handle_file(self, request: web.Request) -> web.Response:
+        self.calls["file"] = self.calls.get("file", 0) + 1
+        file_id = request.match_info["path"].rsplit("/", 1)[-1].rsplit(".", 1)[0]
+        content = self.voice_files.get(file_id)
+        if content is None:
+            return web.Response(status=404)
+        return web.Response(body=content, content_type="audio/wav")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальная заглушка Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8902)
+    parser.add_argument("--latency", type=float, default=0.02, help="задержка ответа, с")
+    args = parser.parse_args()
+
+    print(f"TELEGRAM_API_BASE_URL=http://{args.host}:{args.port}")
+    web.run_app(FakeBotAPI(args.latency).app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
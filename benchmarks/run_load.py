@@ -0,0 +1,283 @@
+import os
+import sys
+import time
+import json
+import types
+import random
+import shutil
+import asyncio
+import argparse
+import tempfile
+import contextvars
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from common import ROOT, BackgroundServer, latency_summary, rss_mb, git_commit, save_results
+from fake_gigachat import FakeGigaChat
+from fake_telegram import FakeBotAPI
+from synthetic_updates import UpdateFactory, make_voice_wav, VOICE_TRANSCRIPTS
+
+
+# Нагрузочный прогон бота без Telegram и GigaChat:
+# заглушки GigaChat и Bot API поднимаются локально, обновления подаются прямо в Dispatcher.
+# Пример: python benchmarks/run_load.py --duration 30 --text-rate 5 --voice-rate 0.5 --stt stub
+# Сравнение с прошлым прогоном: --baseline benchmarks/results/<файл>.json (код выхода 1 при регрессии)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон handle_text / handle_voice / make_report")
+    parser.add_argument("--duration", type=float, default=30, help="длительность подачи обновлений, с")
+    parser.add_argument("--text-rate", type=float, default=5, help="текстовых сообщений в секунду")
+    parser.add_argument("--voice-rate", type=float, default=0.5, help="голосовых в секунду")
+    parser.add_argument("--report-rate", type=float, default=0, help="команд /report в секунду")
+    parser.add_argument("--mention-share", type=float, default=0.5, help="доля текстов с обращением к боту")
+    parser.add_argument("--chats", type=int, default=5)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--gigachat-latency", type=float, default=0.3)
+    parser.add_argument("--gigachat-token-latency", type=float, default=0.002)
+    parser.add_argument("--telegram-latency", type=float, default=0.02)
+    parser.add_argument("--stt", choices=("real", "stub"), default="real",
+                        help="real - Whisper из stt.py, stub - заглушка с фиксированной задержкой")
+    parser.add_argument("--stt-latency", type=float, default=1.0, help="задержка заглушки STT, с")
+    parser.add_argument("--drain-timeout", type=float, default=120, help="ожидание незавершённых обработок, с")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--name", help="имя файла результатов (по умолчанию - время запуска)")
+    parser.add_argument("--baseline", help="файл результатов прошлого прогона для сравнения")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="допустимый рост p95 и падение пропускной способности (доля)")
+    return parser.parse_args()
+
+
+def install_stub_stt(latency: float, seed: int):
+    # Заглушка с тем же интерфейсом, что у stt.py; блокирует поток, как и настоящая модель
+    rng = random.Random(seed)
+    module = types.ModuleType("stt")
+    module.WHISPER_MODEL = "stub"
+    module.DEVICE = "cpu"
+    module.init_stt = lambda: True
+
+    def transcribe_audio(file_path: str) -> str:
+        time.sleep(latency)
+        return rng.choice(VOICE_TRANSCRIPTS)
+
+    async def transcribe_audio_async(file_path: str) -> str:
+        return transcribe_audio(file_path)
+
+    module.transcribe_audio = transcribe_audio
+    module.transcribe_audio_async = transcribe_audio_async
+    sys.modules["stt"] = module
+
+
+# Запросы, которые обработка одного обновления поставила в очередь отправки
+_submitted = contextvars.ContextVar("submitted", default=None)
+
+
+# Обработчики возвращаются, как только ответ поставлен в очередь отправки (user-036):
+# запоминаем эти запросы, чтобы задержка, как и раньше, включала отправку в Telegram
+def track_submits(send_queue):
+    submit = send_queue.submit
+
+    def tracked(method, *args, **kwargs):
+        future = submit(method, *args, **kwargs)
+        submitted = _submitted.get()
+        if submitted is not None:
+            submitted.append(future)
+        return future
+
+    send_queue.submit = tracked
+
+
+async def wait_submitted(submitted: list) -> bool:
+    # Правки по submit_after ставятся, когда отправится первое сообщение - ждём, пока список не перестанет расти
+    waited, failed = 0, False
+    while waited < len(submitted):
+        batch = submitted[waited:]
+        waited = len(submitted)
+        await asyncio.wait(batch)
+        failed = failed or any(not f.cancelled() and f.exception() is not None for f in batch)
+    return not failed
+
+
+def prepare_environment(args, gigachat_url: str, telegram_url: str, workdir: Path):
+    os.environ.update({
+        "GIGACHAT_API_KEY": "bench",
+        "GIGACHAT_SUMMARIZATION_API_KEY": "bench",
+        "TELEGRAM_BOT_TOKEN": "123456:BENCH",
+        "GIGACHAT_BASE_URL": gigachat_url,
+        "GIGACHAT_AUTH_URL": f"{gigachat_url}/oauth",
+        "TELEGRAM_API_BASE_URL": telegram_url,
+        "BOT_MODE": "polling",
+        "METRICS_PORT": "0",
+        "REPORT_CACHE_DIR": str(workdir / "report_cache"),
+        "TOPIC_STATE_PATH": str(workdir / "topic_state.json"),
+        "SESSION_DB_PATH": str(workdir / "sessions.db"),
+        "USAGE_DB_PATH": str(workdir / "usage.db"),
+        "FAQ_INDEX_PATH": str(workdir / "faq_index.json"),
+    })
+
+    # Документы лекции лежат в корне репозитория, временные файлы бота пишем в рабочую папку
+    for name in os.listdir(ROOT):
+        if name.endswith((".docx", ".txt")) and name != "requirements.txt":
+            shutil.copy(ROOT / name, workdir / name)
+    os.chdir(workdir)
+
+    if args.stt == "stub":
+        install_stub_stt(args.stt_latency, args.seed)
+
+
+async def drive(args, bot_module, factory: UpdateFactory) -> dict:
+    from aiogram.types import Update
+
+    dp, bot = bot_module.dp, bot_module.bot
+    latencies = {"text": [], "voice": [], "report": []}
+    errors = {"text": 0, "voice": 0, "report": 0}
+    tasks = []
+
+    async def handle(kind: str, payload: dict, arrival: float):
+        submitted = []
+        _submitted.set(submitted)
+        try:
+            update = Update.model_validate(payload, context={"bot": bot})
+            await dp.feed_update(bot, update)
+            if not await wait_submitted(submitted):
+                errors[kind] += 1
+        except Exception:
+            errors[kind] += 1
+        # Задержка считается от запланированного времени прихода, а не от фактического старта
+        latencies[kind].append(time.perf_counter() - arrival)
+
+    async def produce(kind: str, rate: float, make):
+        if rate <= 0:
+            return
+        count = int(args.duration * rate)
+        for i in range(count):
+            arrival = started + i / rate
+            delay = arrival - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(handle(kind, make(), arrival)))
+
+    started = time.perf_counter()
+    await asyncio.gather(
+        produce("text", args.text_rate, factory.text),
+        produce("voice", args.voice_rate, factory.voice),
+        produce("report", args.report_rate, factory.report),
+    )
+    done, pending = await asyncio.wait(tasks, timeout=args.drain_timeout) if tasks else (set(), set())
+    for task in pending:
+        task.cancel()
+    elapsed = time.perf_counter() - started
+
+    scenarios = {}
+    for kind, values in latencies.items():
+        if values or errors[kind]:
+            scenarios[kind] = latency_summary(values, elapsed)
+            scenarios[kind]["errors"] = errors[kind]
+    return {"elapsed": elapsed, "unfinished": len(pending), "scenarios": scenarios}
+
+
+def compare(results: dict, baseline_path: str, max_regression: float) -> list:
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    problems = []
+    for kind, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(kind)
+        if not previous:
+            continue
+        if previous["p95"] and current["p95"] > previous["p95"] * (1 + max_regression):
+            problems.append(f"{kind}: p95 {previous['p95']:.3f} -> {current['p95']:.3f} с")
+        if previous["throughput"] and current["throughput"] < previous["throughput"] * (1 - max_regression):
+            problems.append(f"{kind}: пропускная способность {previous['throughput']:.2f} -> "
+                            f"{current['throughput']:.2f} в секунду")
+    return problems
+
+
+def print_results(results: dict):
+    print(f"\nКоммит: {results['commit'] or '-'}, длительность: {results['elapsed']:.1f} с, "
+          f"не завершено: {results['unfinished']}")
+    print(f"{'сценарий':8s} {'кол-во':>7s} {'ошибки':>7s} {'в сек':>7s} {'p50':>8s} {'p95':>8s} {'p99':>8s}")
+    for kind, values in results["scenarios"].items():
+        print(f"{kind:8s} {values['count']:7d} {values['errors']:7d} {values['throughput']:7.2f} "
+              f"{values['p50']:8.3f} {values['p95']:8.3f} {values['p99']:8.3f}")
+    print(f"CPU: {results['cpu_seconds']:.1f} с (вместе с заглушками в том же процессе), "
+          f"RSS: {results['rss_mb']:.0f} МБ, пик {results['max_rss_mb']:.0f} МБ")
+    print(f"Вызовы Bot API: {results['backends']['telegram']}")
+    print(f"Вызовы GigaChat: {results['backends']['gigachat']}")
+
+
+def main():
+    args = parse_args()
+
+    gigachat = FakeGigaChat(base_latency=args.gigachat_latency, token_latency=args.gigachat_token_latency)
+    telegram = FakeBotAPI(latency=args.telegram_latency)
+    telegram.voice_files["voice_sample"] = make_voice_wav()
+    gigachat_server = BackgroundServer(gigachat.app()).start()
+    telegram_server = BackgroundServer(telegram.app()).start()
+
+    workdir = Path(tempfile.mkdtemp(prefix="giga_bench_"))
+    prepare_environment(args, gigachat_server.base_url, telegram_server.base_url, workdir)
+
+    # Импорт после настройки окружения: config читает переменные при импорте
+    import bot as bot_module
+    import agent
+    import metrics
+
+    if not agent.init_agent():
+        print("Не удалось инициализировать агента")
+        sys.exit(2)
+    if metrics.ENABLED:
+        bot_module.dp.update.outer_middleware(metrics.UpdateTimingMiddleware())
+        bot_module.bot.session.middleware(metrics.TelegramTimingMiddleware())
+
+    factory = UpdateFactory(args.chats, args.users, args.mention_share, args.seed)
+    cpu_before = os.times()
+
+    async def run():
+        bot_module.setup_blocking_threads()
+        track_submits(bot_module.send_queue)
+        try:
+            return await drive(args, bot_module, factory)
+        finally:
+            # Ответы уходят через очередь отправки - дожидаемся её перед закрытием сессии
+            await bot_module.send_queue.close()
+            await bot_module.bot.session.close()
+
+    results = asyncio.run(run())
+    agent.shutdown_agent()
+    cpu_after = os.times()
+
+    current_rss, peak_rss = rss_mb()
+    results.update({
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": vars(args),
+        "cpu_seconds": (cpu_after.user - cpu_before.user) + (cpu_after.system - cpu_before.system),
+        "rss_mb": current_rss,
+        "max_rss_mb": peak_rss,
+        "stages": metrics.snapshot()["stages"] if metrics.ENABLED else {},
+        "backends": {"telegram": dict(telegram.calls), "gigachat": dict(gigachat.stats)},
+    })
+
+    gigachat_server.stop()
+    telegram_server.stop()
+    os.chdir(ROOT)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    print_results(results)
+    path = save_results(results, args.name)
+    print(f"Результаты сохранены: {path}")
+
+    if args.baseline:
+        problems = compare(results, args.baseline, args.max_regression)
+        if problems:
+            print("\nРегрессия относительно", args.baseline)
+            for problem in problems:
+                print("  " + problem)
+            sys.exit(1)
+        print("\nРегрессий относительно базового прогона нет")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import io
+import time
+import wave
+import random
+import itertools
+
+import numpy as np
+
+
+# Генератор синтетических обновлений Telegram (текст, голос, /report) в виде JSON-словарей
+
+MENTION_QUESTIONS = [
+    "Гигачат, какой основной вывод лекции?",
+    "Гигачат, какие три новых правила ввел спикер?",
+    "Giga, как применить эту идею в небольшой команде?",
+    "Ассистент, что спикер говорил про ответственность?",
+    "Гига, повтори ключевые тезисы выступления",
+]
+CHATTER = [
+    "Коллеги, слайды потом пришлют?",
+    "Отличный доклад!",
+    "Согласен, очень актуально",
+    "Где будет кофе-брейк?",
+]
+# Что "распознаёт" заглушка STT для голосовых
+VOICE_TRANSCRIPTS = [
+    "Гигачат, какой основной вывод лекции?",
+    "Гигачад, что говорили про правила внутри компании?",
+]
+
+
+def make_voice_wav(seconds: float = 3.0, sample_rate: int = 16000) -> bytes:
+    """
+    Тон с паузами: ffmpeg декодирует его так же, как настоящее голосовое
+    """
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    signal = 0.2 * np.sin(2 * np.pi * 220 * t) * (np.sin(2 * np.pi * 2 * t) > 0)
+    pcm = (signal * 32767).astype(np.int16)
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+class UpdateFactory:
+    """
+    Обновления от множества слушателей в нескольких групповых чатах
+    """
+
+    def __init__(self, chats: int = 5, users: int = 200, mention_share: float = 0.5, seed: int = 0):
+        self.rng = random.Random(seed)
+        self.chat_ids = [-(10 ** 12) - i for i in range(chats)]
+        self.user_ids = [10 ** 6 + i for i in range(users)]
+        self.mention_share = mention_share
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    def _message(self, chat_id: int = None, user_id: int = None) -> dict:
+        chat_id = chat_id if chat_id is not None else self.rng.choice(self.chat_ids)
+        user_id = user_id if user_id is not None else self.rng.choice(self.user_ids)
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup", "title": "Конференция"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"Слушатель{user_id % 1000}"},
+        }
+
+    def _update(self, message: dict) -> dict:
+        return {"update_id": next(self._update_ids), "message": message}
+
+    def text(self) -> dict:
+        message = self._message()
+        if self.rng.random() < self.mention_share:
+            message["text"] = self.rng.choice(MENTION_QUESTIONS)
+        else:
+            message["text"] = self.rng.choice(CHATTER)
+        return self._update(message)
+
+    def voice(self, file_id: str = "voice_sample", duration: int = 3) -> dict:
+        message = self._message()
+        message["voice"] = {"file_id": file_id, "file_unique_id": file_id, "duration": duration}
+        return self._update(message)
+
+    def report(self, admin_id: int = 1) -> dict:
+        # В личке команда доступна без проверки прав
+        message = self._message(chat_id=admin_id, user_id=admin_id)
+        message["text"] = "/report"
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": 7}]
+        return self._update(message)
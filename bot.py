@@ -1,29 +1,46 @@
 import asyncio
 import logging
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from aiogram import Bot, Dispatcher, types
-from aiogram.filters import Command
-from aiogram.types import Message
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message, FSInputFile, ChatMemberUpdated
 from aiogram.enums import ParseMode
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.utils.markdown import hbold, hitalic
 
 import config
 import agent
 import stt
+import report_cache
+import metrics
+import usage
+from admin_cache import admin_cache
+from send_queue import send_queue, PROGRESS
+from wake_word import WakeWordMatcher, DEFAULT_NAMES
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-bot = Bot(token=config.TELEGRAM_BOT_TOKEN)
+if config.TELEGRAM_API_BASE_URL:
+    bot = Bot(
+        token=config.TELEGRAM_BOT_TOKEN,
+        session=AiohttpSession(api=TelegramAPIServer.from_base(config.TELEGRAM_API_BASE_URL))
+    )
+else:
+    bot = Bot(token=config.TELEGRAM_BOT_TOKEN)
 dp = Dispatcher()
 
 
-BOT_NAMES = [
-    "Гигачат", "гигачат", "Гига", "гига",
-    "Gigachat", "gigachat", "Giga", "giga",
-    "ассистент"]
+# Отчёты строятся по одному (chart.png, файл отчёта и состояние тем общие); в режиме кластера
+# подменяется общим для процессов замком. Берётся только в потоке, не в цикле событий
+report_lock = threading.Lock()
+
+BOT_NAMES = list(DEFAULT_NAMES)
 
 # Добавляем имя бота из конфига
 if hasattr(config, 'BOT_NAME') and config.BOT_NAME:
@@ -34,63 +51,68 @@ async def is_admin(message: Message) -> bool:
     if message.chat.type == "private":
         return True  # В личке считаем админом
     
+    try:
+        return await admin_cache.is_admin(bot, message.chat.id, message.from_user.id)
+    except Exception as e:
+        logger.warning(f"Не удалось получить администраторов чата {message.chat.id}: {e}")
+
     member = await bot.get_chat_member(message.chat.id, message.from_user.id)
     return member.status in ["creator", "administrator"]
 
+# Поиск обращений собираем один раз при старте
+wake_matcher = WakeWordMatcher(BOT_NAMES)
+
+# Ищем обращение к боту и возвращаем текст вопроса после него (None - обращения нет)
+def extract_question(text: str, fuzzy: bool = False):
+    match = wake_matcher.match(text, fuzzy=fuzzy)
+    if match is None:
+        return None
+
+    kind = "нечёткое" if match.fuzzy else "точное"
+    logger.info(f"Найдено обращение ({kind}): '{text[:match.end].strip()}'")
+    return match.question
+
 # Проверяем, есть ли обращение к боту
-def is_bot_mentioned(text: str) -> bool:
-    if not text or not text.strip():
-        return False
-    
-    first_word = text.strip().split()[0].lower().strip('.,!?;:')
-    
-    # Проверяем 1 слово
-    if first_word in BOT_NAMES:
-        logger.info(f"Найдено обращение: '{first_word}'")
-        return True
-    
-    # Проверяем обращение с @
-    if first_word.startswith('@') and first_word[1:].lower() in [name.lower().replace('@', '') for name in BOT_NAMES]:
-        logger.info(f"Найдено обращение через @: '{first_word}'")
-        return True
-    
-    return False
+def is_bot_mentioned(text: str, fuzzy: bool = False) -> bool:
+    return wake_matcher.match(text, fuzzy=fuzzy) is not None
 
 @dp.message(Command("start"))
 async def cmd_start(message: Message):
-    await message.answer(
+    send_queue.submit(message.answer(
         f"👋 Привет! Я AI-ассистент спикера.\n\n"
         "Я изучил текст выступления и готов отвечать на ваши вопросы.\n\n"
         "❓Чтобы задать вопрос обратесь ко мне по имени.\n"
         "Некоторые допустимые обращения: Gigachat, Гигачат, Giga, Гига или @Giga_AssistantBot.\n\n"
         "🎤 Вы также можете использовать аудиосообщения!\n\n"
         "Пример: Гигачат, какие три новых простых правила жизни внутри компании ввел спикер?"
-    )
+    ))
 
 # перезагрузка агента (админы)
 @dp.message(Command("reload"))
 async def cmd_reload(message: Message):
     if not await is_admin(message):
-        await message.reply("❌ Только администраторы группы могут перезагружать агента")
+        send_queue.submit(message.reply("❌ Только администраторы группы могут перезагружать агента"))
         return
     
-    status_msg = await message.reply("🔄 Перезагружаю агента и сбрасываю историю...")
+    # Сообщение о ходе работы не ждём: правка уйдёт, когда оно отправится
+    status_sent = send_queue.submit(message.reply("🔄 Перезагружаю агента и сбрасываю историю..."), PROGRESS)
     
-    if agent.reload_agent():
-        await status_msg.edit_text("✅ Агент успешно перезагружен!")
-    else:
-        await status_msg.edit_text("❌ Ошибка при перезагрузке агента")
+    # Замок агента может держать перезагрузка лекции в другом потоке - ждём не в цикле событий
+    reloaded = await asyncio.to_thread(agent.reload_agent)
+    result = "✅ Агент успешно перезагружен!" if reloaded else "❌ Ошибка при перезагрузке агента"
+    send_queue.submit_after(status_sent, lambda status_msg: status_msg.edit_text(result),
+                            fallback=message.reply(result))
 
 # сброс истории диалога (админы)
 @dp.message(Command("reset"))
 async def cmd_reset(message: Message):
     if not await is_admin(message):
-        await message.reply("❌ Только администраторы могут сбрасывать историю диалога")
+        send_queue.submit(message.reply("❌ Только администраторы могут сбрасывать историю диалога"))
         return
     
-    # Переинициализируем агента
-    agent.reload_agent()
-    await message.reply("🔄 История диалога сброшена. Можете задавать новые вопросы!")
+    # Сбрасываем историю только этого чата
+    agent.reset_history(message.chat.id)
+    send_queue.submit(message.reply("🔄 История диалога сброшена. Можете задавать новые вопросы!"))
 
 
 @dp.message(Command("help"))
@@ -108,54 +130,89 @@ async def cmd_help(message: Message):
 🔥 Доступные команды:
 /start - начать работу
 /help - справка
-/reset - сбросить историю диалога (только для админов)
-/report - создать отчет по речи спикера (только для админов)"""
+/reset - сбросить историю диалога в этом чате (только для админов)
+/report - создать отчет по речи спикера (только для админов)
+/report force - пересоздать отчет, не используя кэш (только для админов)
+/stats - задержки по этапам обработки (только для админов)
+/usage - расход токенов GigaChat за сутки (только для админов)"""
     
-    await message.answer(help_text)
+    send_queue.submit(message.answer(help_text))
+
+# Сборка отчёта под замком; возвращает путь в кэше или None, если файл не создался
+def _build_report(summa, cache_key: str, output_filename: str):
+    with report_lock:
+        # Удаляем отчёт прошлого запуска, иначе неудачная конвертация закэширует его под новым ключом
+        if os.path.exists(output_filename):
+            os.remove(output_filename)
+
+        summa.create_report(config.QUESTION_DOCUMENT_PATH, output_filename)
+
+        # проверка, создался ли файл (после удаления выше - только этим запуском)
+        if not os.path.exists(output_filename):
+            return None
+        return report_cache.put(cache_key, output_filename)
 
 # обработка команды итогово вывода файла
 @dp.message(Command("report"))
-async def make_report(message: Message):
+async def make_report(message: Message, command: CommandObject):
     if not await is_admin(message):
-        await message.reply("❌ Только администраторы могут сбрасывать историю диалога")
+        send_queue.submit(message.reply("❌ Только администраторы могут сбрасывать историю диалога"))
         return
 
-    status_msg = await message.reply("📊 Начинаю создание отчёта по конференции..."
-                                     "\nЭто может занять некоторое время.")
     # импорт и инициализация бота суммарайзера
-    from summarizer import Summarizer
-    summa = Summarizer(config.GIGACHAT_SUMMARIZATION_API_KEY)
+    from summarizer import Summarizer, PROMPT_VERSION
     output_filename = "Отчёт_по_конференции.pdf"
+    force = (command.args or "").strip().lower() in ("force", "-f", "--force")
+
+    # Ищем готовый отчёт по тем же документам, промпту и модели
+    cache_key = report_cache.make_key(
+        config.QUESTION_DOCUMENT_PATH, PROMPT_VERSION, config.GIGACHAT_SUMMARIZATION_MODEL
+    )
+    cached_path = None if force else report_cache.get(cache_key)
+
+    if cached_path:
+        send_queue.submit(message.reply_document(
+            document=FSInputFile(cached_path, filename=output_filename),
+            caption=f"✅ Отчёт взят из кэша (документы не менялись).\nФайл: {output_filename}"
+        ))
+        return
 
-    await status_msg.edit_text(
+    # Сообщения о ходе работы не ждём: отчёт строится, пока они стоят в очереди отправки
+    status_sent = send_queue.submit(message.reply("📊 Начинаю создание отчёта по конференции..."
+                                                  "\nЭто может занять некоторое время."), PROGRESS)
+    summa = Summarizer(config.GIGACHAT_SUMMARIZATION_API_KEY, config.GIGACHAT_SUMMARIZATION_MODEL,
+                       chat_id=message.chat.id, user_id=message.from_user.id)
+
+    send_queue.submit_after(status_sent, lambda status_msg: status_msg.edit_text(
         f"{status_msg.text}\n"
         f"🔄 Обрабатываю запрос к GigaChat..."
-    )
+    ), PROGRESS)
 
-    # запуск создания отчёта
-    summa.create_report(config.QUESTION_DOCUMENT_PATH, output_filename)
+    # запуск создания отчёта: ожидание замка и сборка - в потоке, цикл событий не блокируется
+    cached_path = await asyncio.to_thread(_build_report, summa, cache_key, output_filename)
 
-    # проверка, создался ли файл
-    if os.path.exists(output_filename):
-        with open(output_filename, 'rb') as pdf_file:
-            await message.reply_document(
-                document=pdf_file,
-                caption=f"✅ Отчёт успешно создан!\nФайл: {output_filename}",
-                reply_to_message_id=message.message_id
-            )
+    if cached_path:
+        send_queue.submit(message.reply_document(
+            document=FSInputFile(cached_path, filename=output_filename),
+            caption=f"✅ Отчёт успешно создан!\nФайл: {output_filename}"
+        ))
 
-        await status_msg.delete()
+        # Удаление заменит ещё не отправленную правку статуса
+        send_queue.submit_after(status_sent, lambda status_msg: status_msg.delete())
         # os.remove(output_filename)
 
     else:
-        await status_msg.edit_text("❌ Не удалось создать PDF-файл с отчётом")
+        error_text = "❌ Не удалось создать PDF-файл с отчётом"
+        send_queue.submit_after(status_sent, lambda status_msg: status_msg.edit_text(error_text),
+                                fallback=message.reply(error_text))
 
 # обработка текстовых сообщений с проверкой обращений
 @dp.message(lambda message: message.text and not message.text.startswith('/'))
 async def handle_text(message: Message):
     
     # Проверяем есть ли обращение к боту?
-    if not is_bot_mentioned(message.text):
+    question_text = extract_question(message.text)
+    if question_text is None:
 
         logger.info(f"Игнорируем сообщение без обращения от {message.from_user.full_name}: {message.text[:30]}...")
         return
@@ -165,33 +222,24 @@ async def handle_text(message: Message):
 
     user_name = message.from_user.first_name or message.from_user.username or "Слушатель"
     
-    words = message.text.strip().split()
-    if len(words) > 1:
-        # Убираем запятую после обращения, если есть
-        question_text = ' '.join(words[1:]).lstrip(', ')
-    else:
-        question_text = ""  
-    
     # Если после обращения ничего нет - просим задать вопрос
     if not question_text:
-        await message.reply(
-            f"""{user_name}, я слушаю! Задайте ваш вопрос по лекции.\nПамятка - /help""",
-            reply_to_message_id=message.message_id
-        )
+        send_queue.submit(message.reply(
+            f"""{user_name}, я слушаю! Задайте ваш вопрос по лекции.\nПамятка - /help"""
+        ))
         return
     
     # Показываем, что бот печатает
     await bot.send_chat_action(message.chat.id, action="typing")
     
-    # Получаем ответ от агента
-    answer = agent.ask_agent(question_text)
+    # Получаем ответ от агента (запрос к GigaChat синхронный - уводим его из event loop)
+    answer = await asyncio.to_thread(agent.ask_agent, question_text, message.chat.id, message.from_user.id)
     personalized_answer = f"{user_name}, {answer}"
     
-    # Отправляем ответ с reply на сообщение пользователя
-    await message.reply(
-        personalized_answer,
-        reply_to_message_id=message.message_id
-    )
+    # Отправляем ответ с reply на сообщение пользователя (через очередь, не дожидаясь отправки)
+    send_queue.submit(message.reply(
+        personalized_answer
+    ))
 
 # Обработчик голосовых сообщений
 @dp.message(lambda message: message.voice)
@@ -201,46 +249,40 @@ async def handle_voice(message: Message):
     user_name = message.from_user.first_name or message.from_user.username or "Слушатель"
     
     # Проверяем текстовую подпись к голосовому (если есть)
-    if message.caption and is_bot_mentioned(message.caption):
+    question_text = extract_question(message.caption) if message.caption else None
+    if question_text is not None:
         logger.info(f"Голосовое с текстовой подписью-обращением")
         
-        # Удаляем обращение из подписи
-        words = message.caption.strip().split()
-        if len(words) > 1:
-            question_text = ' '.join(words[1:]).lstrip(', ')
-        else:
-            question_text = ""
-        
         if question_text:
             await bot.send_chat_action(message.chat.id, action="typing")
             
             # Получаем ответ от агента
-            answer = agent.ask_agent(question_text)
+            answer = await asyncio.to_thread(agent.ask_agent, question_text, message.chat.id,
+                                             message.from_user.id, "voice")
             personalized_answer = f"{user_name}, {answer}"
             
             # Отправляем ответ 
-            await message.reply(
-                personalized_answer,
-                reply_to_message_id=message.message_id
-            )
+            send_queue.submit(message.reply(
+                personalized_answer
+            ))
         else:
             # Если в подписи только обращение без вопроса
-            await message.reply(
-                f"{user_name}, я слушаю! Задайте ваш вопрос.",
-                reply_to_message_id=message.message_id
-            )
+            send_queue.submit(message.reply(
+                f"{user_name}, я слушаю! Задайте ваш вопрос."
+            ))
         return
     
     # Если нет подписи, скачиваем аудио для распознавания
     try:
         # Скачиваем голосовое сообщение
-        file = await bot.get_file(message.voice.file_id)
         file_path = f"voice_{message.from_user.id}_{message.message_id}.ogg"
-        await bot.download_file(file.file_path, file_path)
+        with metrics.timer("voice_download"):
+            file = await bot.get_file(message.voice.file_id)
+            await bot.download_file(file.file_path, file_path)
         
         # Транскрибируем аудио
         logger.info("Запускаем транскрибацию...")
-        transcribed_text = stt.transcribe_audio(file_path)
+        transcribed_text = await stt.transcribe_audio_async(file_path)
         
         os.remove(file_path)
         
@@ -251,40 +293,35 @@ async def handle_voice(message: Message):
         
         logger.info(f"Распознанный текст: {transcribed_text[:100]}...")
         
-        # Проверяем, есть ли обращение в распознанном тексте
-        if is_bot_mentioned(transcribed_text):
+        # Проверяем, есть ли обращение в распознанном тексте (Whisper может исказить имя)
+        question_text = extract_question(transcribed_text, fuzzy=True)
+        if question_text is not None:
             logger.info("Обнаружено обращение к боту в голосовом сообщении")
             
-            # Отправляем уведомление о начале обработки
-            processing_msg = await message.reply(
-                f"{user_name}, 🎤 распознаю ваше голосовое сообщение...",
-                reply_to_message_id=message.message_id
-            )
-            
-            # Удаляем обращение из текста
-            words = transcribed_text.strip().split()
-            if len(words) > 1:
-                question_text = ' '.join(words[1:]).lstrip(', ')
-            else:
-                question_text = ""
+            # Отправляем уведомление о начале обработки (не дожидаясь его отправки)
+            processing_sent = send_queue.submit(message.reply(
+                f"{user_name}, 🎤 распознаю ваше голосовое сообщение..."
+            ), PROGRESS)
             
             if question_text:
                 # Получаем ответ от агента
                 await bot.send_chat_action(message.chat.id, action="typing")
-                answer = agent.ask_agent(question_text)
+                answer = await asyncio.to_thread(agent.ask_agent, question_text, message.chat.id,
+                                                 message.from_user.id, "voice")
                 personalized_answer = f"{user_name}, {answer}"
                 
                 # Обновляем сообщение о процессе на финальный ответ
-                await processing_msg.edit_text(
+                send_queue.submit_after(processing_sent, lambda processing_msg: processing_msg.edit_text(
                     personalized_answer,
                     reply_to_message_id=message.message_id
-                )
+                ), fallback=message.reply(personalized_answer))
             else:
                 # Если после обращения нет текста
-                await processing_msg.edit_text(
-                    f"{user_name}, я слушаю! Задайте ваш вопрос.",
+                listening = f"{user_name}, я слушаю! Задайте ваш вопрос."
+                send_queue.submit_after(processing_sent, lambda processing_msg: processing_msg.edit_text(
+                    listening,
                     reply_to_message_id=message.message_id
-                )
+                ), fallback=message.reply(listening))
         else:
             logger.info("В распознанном тексте нет обращения к боту - игнорируем")
             
@@ -296,19 +333,48 @@ async def handle_voice(message: Message):
 @dp.message(Command("test_stt"))
 async def cmd_test_stt(message: Message):
     if not await is_admin(message):
-        await message.reply("❌ Только администраторы могут тестировать STT")
+        send_queue.submit(message.reply("❌ Только администраторы могут тестировать STT"))
         return
     
-    await message.reply(
+    send_queue.submit(message.reply(
         "🔄 Инициализирую STT модель...\n"
         f"Модель: {stt.WHISPER_MODEL}\n"
         f"Устройство: {stt.DEVICE}"
-    )
+    ))
     
-    if stt.init_stt():
-        await message.reply("✅ STT модель успешно загружена и готова к работе!")
+    # В режиме кластера это синхронный запрос к STT сервису - не держим им цикл событий
+    if await asyncio.to_thread(stt.init_stt):
+        send_queue.submit(message.reply("✅ STT модель успешно загружена и готова к работе!"))
     else:
-        await message.reply("❌ Ошибка загрузки STT модели")
+        send_queue.submit(message.reply("❌ Ошибка загрузки STT модели"))
+
+# изменения прав участников держат кэш администраторов актуальным
+@dp.chat_member()
+async def on_chat_member(event: ChatMemberUpdated):
+    admin_cache.on_chat_member(event)
+
+# права самого бота изменились - список администраторов запросим заново
+@dp.my_chat_member()
+async def on_my_chat_member(event: ChatMemberUpdated):
+    admin_cache.forget(event.chat.id)
+
+# Задержки по этапам (админы)
+@dp.message(Command("stats"))
+async def cmd_stats(message: Message):
+    if not await is_admin(message):
+        send_queue.submit(message.reply("❌ Только администраторы могут смотреть статистику"))
+        return
+
+    send_queue.submit(message.reply(f"📈 Статистика:\n\n{metrics.format_stats()}"))
+
+# Расход токенов за сутки (админы)
+@dp.message(Command("usage"))
+async def cmd_usage(message: Message):
+    if not await is_admin(message):
+        send_queue.submit(message.reply("❌ Только администраторы могут смотреть расход токенов"))
+        return
+
+    send_queue.submit(message.reply(f"💰 {usage.tracker.format_usage()}"))
 
 # остальные типы сообщений просто игнорируем
 @dp.message(lambda message: message.new_chat_members)
@@ -332,9 +398,21 @@ async def ignore_sticker(message: Message):
 async def ignore_document(message: Message):
     logger.info(f"Документ от {message.from_user.full_name}, игнорируем")
 
+# Пул потоков для синхронных вызовов (asyncio.to_thread): по потоку на каждого воркера webhook
+def setup_blocking_threads():
+    threads = max(config.BLOCKING_THREADS, config.WEBHOOK_WORKERS)
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=threads))
+
 # Основная функция 
 async def main():
     logger.info(f"Загружены обращения: {BOT_NAMES}")
+    setup_blocking_threads()
+    
+    # Режим кластера: этот процесс только принимает обновления и раздаёт их воркерам
+    if config.CLUSTER_WORKERS > 0:
+        import cluster
+        await cluster.run_front(bot, dp)
+        return
     
     # Инициализируем агента (загружаем документ)
     logger.info("Инициализация агента...")
@@ -345,9 +423,31 @@ async def main():
     logger.info("Инициализация STT...")
     stt.init_stt()
     
+    # Замеры входящих обновлений и запросов к Bot API только при включённых метриках
+    if metrics.ENABLED:
+        dp.update.outer_middleware(metrics.UpdateTimingMiddleware())
+        bot.session.middleware(metrics.TelegramTimingMiddleware())
+        if config.METRICS_PORT:
+            await metrics.start_http_server(config.METRICS_HOST, config.METRICS_PORT)
+    
+    if config.BOT_MODE == "webhook":
+        import webhook
+        logger.info("Запуск бота в режиме webhook...")
+        try:
+            await webhook.run_webhook(bot, dp)
+        finally:
+            await send_queue.close()
+            agent.shutdown_agent()
+        return
+
     await bot.delete_webhook(drop_pending_updates=True)
     logger.info("Запуск бота...")
-    await dp.start_polling(bot)
+    try:
+        # chat_member приходят только если запросить их явно
+        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+    finally:
+        await send_queue.close()
+        agent.shutdown_agent()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
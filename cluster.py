@@ -0,0 +1,434 @@
+import os
+import time
+import queue
+import signal
+import asyncio
+import logging
+import threading
+import multiprocessing as mp
+from multiprocessing.connection import wait
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher, BaseMiddleware
+from aiogram.types import Update
+
+import config
+import metrics
+from webhook import shard_key
+
+
+logger = logging.getLogger(__name__)
+
+# Конец работы в очереди обновлений и в каналах STT
+_STOP = None
+
+
+class _Forwarder(BaseMiddleware):
+    """
+    Внешний middleware диспетчера фронта: вместо обработки отдаёт обновление воркеру
+    """
+
+    def __init__(self, front: "ClusterFront"):
+        self.front = front
+
+    async def __call__(self, handler, event: Update, data: dict):
+        await self.front.forward(event)
+
+
+class ClusterFront:
+    """
+    Фронт кластера: раздаёт обновления воркерам по chat.id (чат всегда в одном воркере,
+    поэтому порядок сообщений чата сохраняется), следит за heartbeat воркеров и STT сервиса,
+    перезапускает упавшие процессы и при остановке дожидается обработки принятого.
+    Статусы и запросы к STT идут по Pipe, у которых нет общих замков: процесс,
+    убитый посреди чтения, не блокирует остальных
+    """
+
+    def __init__(self, workers: int, queue_size: int):
+        """
+        Args:
+            workers: число процессов-воркеров
+            queue_size: максимум необработанных обновлений в очереди воркера
+        """
+        # spawn: воркеры не наследуют event loop и потоки фронта
+        self.ctx = mp.get_context("spawn")
+        self.queue_size = queue_size
+        self.update_queues = [None] * workers
+        # Канал воркер <-> STT сервис: (конец воркера, конец сервиса)
+        self.stt_pipes = [self.ctx.Pipe() for _ in range(workers)]
+        # Свой канал фронта к STT сервису - только для команды остановки
+        self.stt_control = self.ctx.Pipe()
+        self.report_lock = self.ctx.Lock()
+
+        self.workers = [None] * workers
+        self.stt_process = None
+        self.health = {}     # имя процесса -> pid, состояние, время heartbeat, очередь
+        self._status = {}    # канал статусов -> имя процесса
+        self._metrics = {}   # имя процесса -> последние данные metrics.export() из heartbeat
+        self._draining = False
+        # Обновление воркеру ждёт в очереди его шарда: одна задача на шард кладёт их в mp очередь
+        # по порядку, даже когда та заполнена и приходится ждать
+        self._pending = []
+        self._forwarders = []
+
+    def start(self):
+        self._spawn_stt()
+        for index in range(len(self.workers)):
+            self._spawn_worker(index)
+        self._pending = [asyncio.Queue(maxsize=self.queue_size) for _ in self.workers]
+        self._forwarders = [asyncio.create_task(self._forward_loop(index)) for index in range(len(self.workers))]
+        logger.info(f"Запущено воркеров: {len(self.workers)} и STT сервис")
+
+    def _spawn_worker(self, index: int):
+        # Лимит отправки общий на бота - делим между воркерами. FAQ индекс после смены лекции
+        # пересобирает только worker-0, остальные подхватывают его файл
+        env = {
+            "CLUSTER_WORKERS": "0",
+            "FAQ_BUILD": "1" if index == 0 else "0",
+            "SEND_GLOBAL_RATE": str(config.SEND_GLOBAL_RATE / len(self.workers)),
+            # /metrics отдаёт фронт, сложив данные всех процессов
+            "METRICS_PORT": "0",
+        }
+        # Очередь каждый раз новая: убитый процесс мог оставить замок старой захваченным
+        old_queue = self.update_queues[index]
+        self.update_queues[index] = self.ctx.Queue(maxsize=self.queue_size)
+        if old_queue is not None:
+            self._move_updates(index, old_queue)
+        args = (index, self.update_queues[index], self.stt_pipes[index][0], self.report_lock)
+        self.workers[index] = self._spawn(f"worker-{index}", _worker_main, args, env)
+
+    def _move_updates(self, index: int, old_queue):
+        # Обновления, которые упавший воркер не успел взять, отдаём новому
+        moved = lost = 0
+        while True:
+            try:
+                # С таймаутом: если замок чтения остался у убитого процесса, не ждём его вечно
+                raw = old_queue.get(True, 0.1)
+            except (queue.Empty, OSError, EOFError):
+                break
+            try:
+                self.update_queues[index].put_nowait(raw)
+                moved += 1
+            except queue.Full:
+                lost += 1
+        try:
+            lost += old_queue.qsize()
+        except NotImplementedError:
+            pass
+        old_queue.cancel_join_thread()
+        old_queue.close()
+        if moved or lost:
+            logger.warning(f"worker-{index}: перенесено в новую очередь обновлений: {moved}, потеряно: {lost}")
+
+    def _spawn_stt(self):
+        connections = [pipe[1] for pipe in self.stt_pipes] + [self.stt_control[1]]
+        self.stt_process = self._spawn("stt", _stt_main, (connections,))
+
+    def _spawn(self, name: str, target, args: tuple, env: dict = None) -> mp.Process:
+        status_reader, status_writer = self.ctx.Pipe(duplex=False)
+        # Дочерний процесс читает config при импорте, поэтому настройки передаём через окружение
+        saved = {key: os.environ.get(key) for key in env or {}}
+        os.environ.update(env or {})
+        try:
+            process = self.ctx.Process(target=target, name=name, args=(status_writer, *args), daemon=True)
+            process.start()
+        finally:
+            for key, value in saved.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+        # Свой экземпляр пишущего конца закрываем: после смерти процесса чтение даст EOF
+        status_writer.close()
+
+        for connection, owner in list(self._status.items()):
+            if owner == name:
+                del self._status[connection]
+                connection.close()
+        self._status[status_reader] = name
+        self.health[name] = {"pid": process.pid, "state": "starting", "heartbeat": time.monotonic(), "pending": 0}
+        return process
+
+    async def forward(self, update: Update):
+        index = shard_key(update) % len(self.update_queues)
+        raw = update.model_dump_json(by_alias=True, exclude_none=True)
+        await self._pending[index].put(raw)
+
+    async def _forward_loop(self, index: int):
+        loop = asyncio.get_running_loop()
+        pending = self._pending[index]
+        while True:
+            raw = await pending.get()
+            try:
+                self.update_queues[index].put_nowait(raw)
+            except queue.Full:
+                logger.warning(f"Очередь воркера {index} заполнена - ждём")
+                # Очередь перечитываем на каждой попытке: упавший воркер перезапускается с новой
+                while True:
+                    try:
+                        await loop.run_in_executor(None, self.update_queues[index].put, raw, True, 1.0)
+                        break
+                    except queue.Full:
+                        continue
+            pending.task_done()
+            if raw is _STOP:
+                return
+
+    def _collect_status(self):
+        for connection in wait(list(self._status), timeout=0):
+            name = self._status[connection]
+            try:
+                while connection.poll():
+                    state, pending, data = connection.recv()
+                    self.health[name].update(state=state, heartbeat=time.monotonic(), pending=pending)
+                    if data is not None:
+                        self._metrics[name] = data
+            except (EOFError, OSError):
+                # Процесс завершился - его перезапустит _check_processes
+                del self._status[connection]
+                connection.close()
+
+    def _check_processes(self):
+        now = time.monotonic()
+        processes = [(f"worker-{i}", process) for i, process in enumerate(self.workers)]
+        processes.append(("stt", self.stt_process))
+
+        for name, process in processes:
+            age = now - self.health[name]["heartbeat"]
+            if process.is_alive() and age <= config.CLUSTER_HEARTBEAT_TIMEOUT:
+                continue
+            if process.is_alive():
+                logger.error(f"{name}: нет heartbeat {age:.0f} с - перезапускаем")
+                process.terminate()
+                process.join(5)
+            else:
+                logger.error(f"{name}: процесс завершился с кодом {process.exitcode} - перезапускаем")
+
+            if name == "stt":
+                self._spawn_stt()
+            else:
+                self._spawn_worker(int(name.split("-")[1]))
+
+    async def monitor(self):
+        while True:
+            await asyncio.sleep(config.CLUSTER_HEARTBEAT_INTERVAL)
+            self._collect_status()
+            if not self._draining:
+                self._check_processes()
+
+    def health_report(self) -> tuple:
+        self._collect_status()
+        now = time.monotonic()
+        processes = dict((f"worker-{i}", process) for i, process in enumerate(self.workers))
+        processes["stt"] = self.stt_process
+
+        report, healthy = {}, True
+        for name, process in processes.items():
+            info = self.health[name]
+            age = now - info["heartbeat"]
+            ok = process.is_alive() and age <= config.CLUSTER_HEARTBEAT_TIMEOUT
+            healthy = healthy and ok
+            report[name] = {"pid": info["pid"], "alive": process.is_alive(), "state": info["state"],
+                            "heartbeat_age": round(age, 1), "pending": info["pending"], "ok": ok}
+        return report, healthy
+
+    def render_metrics(self) -> str:
+        self._collect_status()
+        return metrics.render_prometheus(metrics.merge([metrics.export(), *self._metrics.values()]))
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        report, healthy = self.health_report()
+        return web.json_response(report, status=200 if healthy else 503)
+
+    async def start_health_server(self, host: str, port: int) -> web.AppRunner:
+        app = web.Application()
+        app.router.add_get("/health", self.handle_health)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        logger.info(f"Проверка состояния кластера: http://{host}:{port}/health")
+        return runner
+
+    async def stop(self, timeout: float):
+        """
+        Воркеры дорабатывают всё, что уже в их очередях, затем останавливается STT сервис
+        """
+        self._draining = True
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + timeout
+        # _STOP идёт за уже принятыми обновлениями шарда
+        try:
+            await asyncio.wait_for(asyncio.gather(*(pending.put(_STOP) for pending in self._pending)), timeout)
+        except asyncio.TimeoutError:
+            pass
+        _, late = await asyncio.wait(self._forwarders, timeout=max(0.0, deadline - time.monotonic()))
+        if late:
+            logger.warning(f"Не все принятые обновления переданы воркерам за {timeout} с")
+            for forwarder in late:
+                forwarder.cancel()
+
+        for process in self.workers:
+            await loop.run_in_executor(None, process.join, max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning(f"{process.name} не успел завершиться за {timeout} с - останавливаем")
+                process.terminate()
+
+        self.stt_control[0].send(_STOP)
+        await loop.run_in_executor(None, self.stt_process.join, 10)
+        if self.stt_process.is_alive():
+            self.stt_process.terminate()
+        logger.info("Кластер остановлен")
+
+
+def _ignore_signals():
+    # Остановкой дочерних процессов управляет фронт (через очереди), а не Ctrl+C/SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+
+class _StatusSender:
+    """
+    Отправка статуса фронту из основного потока и потока heartbeat
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._lock = threading.Lock()
+
+    def send(self, state: str, pending: int = 0, data: dict = None):
+        with self._lock:
+            try:
+                self.connection.send((state, pending, data))
+            except OSError:
+                pass
+
+    def start_heartbeat(self, pending=lambda: 0) -> threading.Event:
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(config.CLUSTER_HEARTBEAT_INTERVAL):
+                # Вместе с heartbeat - замеры процесса для общего /metrics на фронте
+                self.send("alive", pending(), metrics.export() if metrics.ENABLED else None)
+
+        threading.Thread(target=beat, name="heartbeat", daemon=True).start()
+        return stop
+
+
+def _stt_main(status_connection, connections: list):
+    _ignore_signals()
+    logging.basicConfig(level=logging.INFO)
+    status = _StatusSender(status_connection)
+    heartbeat = status.start_heartbeat()
+
+    import stt
+    if stt.init_stt():
+        status.send("ready")
+    stt.serve(connections)
+
+    heartbeat.set()
+    status.send("stopped")
+
+
+def _worker_main(status_connection, index: int, updates, stt_connection, report_lock):
+    _ignore_signals()
+    name = f"worker-{index}"
+    status = _StatusSender(status_connection)
+    # heartbeat до тяжёлых импортов и загрузки лекции, чтобы фронт не счёл воркер зависшим
+    ingress_holder = []
+    heartbeat = status.start_heartbeat(lambda: ingress_holder[0].pending() if ingress_holder else 0)
+
+    import stt
+    stt.connect_service(stt_connection, config.STT_SERVICE_TIMEOUT)
+
+    import bot as bot_module
+    import agent
+    bot_module.report_lock = report_lock
+    if not agent.init_agent():
+        logger.error(f"{name}: не удалось загрузить документ! Воркер будет работать без знаний.")
+
+    status.send("ready")
+    try:
+        asyncio.run(_serve_worker(name, updates, bot_module, ingress_holder))
+    finally:
+        agent.shutdown_agent()
+        heartbeat.set()
+        status.send("stopped", 0, metrics.export() if metrics.ENABLED else None)
+
+
+async def _serve_worker(name: str, updates, bot_module, ingress_holder: list):
+    import webhook
+    from send_queue import send_queue
+
+    bot, dp = bot_module.bot, bot_module.dp
+    bot_module.setup_blocking_threads()
+    if metrics.ENABLED:
+        dp.update.outer_middleware(metrics.UpdateTimingMiddleware())
+        bot.session.middleware(metrics.TelegramTimingMiddleware())
+
+    # Внутри воркера - те же очереди по чатам, что и в режиме webhook
+    ingress = webhook.WebhookIngress(bot, dp, secret="", workers=config.WEBHOOK_WORKERS,
+                                     queue_size=config.WEBHOOK_QUEUE_SIZE)
+    ingress.start()
+    ingress_holder.append(ingress)
+
+    loop = asyncio.get_running_loop()
+    while True:
+        raw = await loop.run_in_executor(None, updates.get)
+        if raw is _STOP:
+            break
+        try:
+            update = Update.model_validate_json(raw, context={"bot": bot})
+        except Exception as e:
+            logger.warning(f"{name}: не удалось разобрать обновление: {e}")
+            continue
+        await ingress.enqueue(update)
+
+    logger.info(f"{name}: дорабатываем принятые обновления")
+    await ingress.stop()
+    await send_queue.close()
+    await bot.session.close()
+
+
+# Запуск фронта: приём обновлений (polling или webhook) и раздача воркерам
+async def run_front(bot: Bot, dp: Dispatcher):
+    import agent
+
+    # FAQ индекс собираем один раз здесь, воркеры поднимут его с диска
+    if agent.init_agent() and config.FAQ_ENABLED:
+        logger.info("Ждём FAQ индекс перед запуском воркеров...")
+        await asyncio.get_running_loop().run_in_executor(None, agent.wait_faq_index, 300)
+    agent.shutdown_agent()
+
+    front = ClusterFront(config.CLUSTER_WORKERS, config.CLUSTER_QUEUE_SIZE)
+    front.start()
+    monitor = asyncio.create_task(front.monitor())
+    health_runner = None
+    if config.CLUSTER_HEALTH_PORT:
+        health_runner = await front.start_health_server(config.CLUSTER_HEALTH_HOST, config.CLUSTER_HEALTH_PORT)
+    metrics_runner = None
+    if metrics.ENABLED and config.METRICS_PORT:
+        metrics_runner = await metrics.start_http_server(config.METRICS_HOST, config.METRICS_PORT,
+                                                         render=front.render_metrics)
+
+    # Типы обновлений берём у диспетчера с обработчиками, сами обработчики работают в воркерах
+    allowed_updates = dp.resolve_used_update_types()
+    front_dp = Dispatcher()
+    front_dp.update.outer_middleware(_Forwarder(front))
+
+    try:
+        if config.BOT_MODE == "webhook":
+            import webhook
+            logger.info("Запуск фронта кластера в режиме webhook...")
+            await webhook.run_webhook(bot, front_dp, allowed_updates=allowed_updates)
+        else:
+            await bot.delete_webhook(drop_pending_updates=True)
+            logger.info("Запуск фронта кластера...")
+            # Обновления по одному: пока очередь шарда заполнена, следующее не обгонит ждущие
+            await front_dp.start_polling(bot, allowed_updates=allowed_updates, handle_as_tasks=False)
+    finally:
+        monitor.cancel()
+        await front.stop(config.CLUSTER_DRAIN_TIMEOUT)
+        if health_runner is not None:
+            await health_runner.cleanup()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
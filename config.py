@@ -7,12 +7,99 @@ GIGACHAT_API_KEY = os.getenv("GIGACHAT_API_KEY")
 GIGACHAT_SUMMARIZATION_API_KEY = os.getenv("GIGACHAT_SUMMARIZATION_API_KEY")
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 BOT_NAME = "@Giga_AssistantBot"
+# Свой сервер Bot API (локальный telegram-bot-api или заглушка из benchmarks/), пусто - api.telegram.org
+TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL", "")
 
 
 LECTURE_DOCUMENT_PATH = "./речь_спикера.docx"  
 QUESTION_DOCUMENT_PATH = [LECTURE_DOCUMENT_PATH, "./вопросы.txt"]
 
+# Модель для отчётов (входит в ключ кэша отчётов)
+GIGACHAT_SUMMARIZATION_MODEL = os.getenv("GIGACHAT_SUMMARIZATION_MODEL", "GigaChat")
+
+# Кэш готовых отчётов: папка и максимальный размер на диске
+REPORT_CACHE_DIR = os.getenv("REPORT_CACHE_DIR", "./report_cache")
+REPORT_CACHE_MAX_BYTES = int(os.getenv("REPORT_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+
+# Состояние инкрементальной аналитики вопросов (темы между запусками /report)
+TOPIC_STATE_PATH = os.getenv("TOPIC_STATE_PATH", "./topic_state.json")
+
+# Режим получения обновлений: "polling" или "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")  # внешний адрес, пусто - webhook не регистрируется
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "8"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+# Потоки для синхронных запросов к GigaChat и сборки отчётов (не меньше WEBHOOK_WORKERS)
+BLOCKING_THREADS = int(os.getenv("BLOCKING_THREADS", "32"))
+
+# Через сколько секунд список администраторов чата запрашивается заново
+ADMIN_CACHE_TTL = float(os.getenv("ADMIN_CACHE_TTL", "600"))
+
+# Метрики задержек: /stats и эндпоинт /metrics в формате Prometheus (порт 0 - без HTTP)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# По умолчанию HTTP выключен: привычный 9100 обычно занят node_exporter. В режиме кластера /metrics
+# отдаёт фронт - сумму по всем процессам (с задержкой до heartbeat), /stats - только воркер, принявший команду
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_PREFIX = "giga_assistant"
+
+# История диалогов на диске (SQLite) и сколько последних сообщений чата помнить
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "./sessions.db")
+CHAT_HISTORY_LIMIT = int(os.getenv("CHAT_HISTORY_LIMIT", "40"))
+SESSION_FLUSH_INTERVAL = float(os.getenv("SESSION_FLUSH_INTERVAL", "0.5"))
+SESSION_COMPACT_INTERVAL = float(os.getenv("SESSION_COMPACT_INTERVAL", "3600"))
+
+# Передавать X-Session-ID, чтобы GigaChat переиспользовал обработанный системный промпт чата
+GIGACHAT_PREFIX_CACHE = os.getenv("GIGACHAT_PREFIX_CACHE", "1") == "1"
+
+# Лимиты исходящих сообщений (у Telegram: ~30 в секунду всего, 1 в секунду в личку, 20 в минуту в группу)
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "25"))
+SEND_PRIVATE_RATE = float(os.getenv("SEND_PRIVATE_RATE", "1"))
+SEND_GROUP_RATE = float(os.getenv("SEND_GROUP_RATE", str(20 / 60)))
+SEND_CHAT_BURST = int(os.getenv("SEND_CHAT_BURST", "3"))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "5"))
+# Через сколько секунд сообщение о ходе обработки отправляется наравне с ответами
+SEND_PROGRESS_MAX_WAIT = float(os.getenv("SEND_PROGRESS_MAX_WAIT", "10"))
+
+# Учёт токенов GigaChat и суточные квоты (0 - без ограничения); после ECONOMY_THRESHOLD
+# доли квоты ответы идут в экономном режиме: короче история и ограничена длина ответа
+USAGE_DB_PATH = os.getenv("USAGE_DB_PATH", "./usage.db")
+USER_DAILY_TOKEN_QUOTA = int(os.getenv("USER_DAILY_TOKEN_QUOTA", "0"))
+CHAT_DAILY_TOKEN_QUOTA = int(os.getenv("CHAT_DAILY_TOKEN_QUOTA", "0"))
+ECONOMY_THRESHOLD = float(os.getenv("ECONOMY_THRESHOLD", "0.8"))
+ECONOMY_HISTORY_MESSAGES = int(os.getenv("ECONOMY_HISTORY_MESSAGES", "6"))
+ECONOMY_MAX_TOKENS = int(os.getenv("ECONOMY_MAX_TOKENS", "300"))
+
+# Заранее подготовленные ответы на частые вопросы (собираются в фоне после загрузки лекции)
+FAQ_ENABLED = os.getenv("FAQ_ENABLED", "1") == "1"
+FAQ_INDEX_PATH = os.getenv("FAQ_INDEX_PATH", "./faq_index.json")
+FAQ_SIZE = int(os.getenv("FAQ_SIZE", "30"))
+FAQ_THRESHOLD = float(os.getenv("FAQ_THRESHOLD", "0.75"))
+# Как часто (в секундах) проверять, не поменялись ли файл лекции и файл FAQ индекса
+FAQ_CHECK_INTERVAL = float(os.getenv("FAQ_CHECK_INTERVAL", "30"))
+
+# Режим кластера: фронт раздаёт обновления по chat.id в CLUSTER_WORKERS процессов (0 - один процесс),
+# распознавание речи - в одном общем процессе STT
+CLUSTER_WORKERS = int(os.getenv("CLUSTER_WORKERS", "0"))
+CLUSTER_QUEUE_SIZE = int(os.getenv("CLUSTER_QUEUE_SIZE", "1000"))
+CLUSTER_HEARTBEAT_INTERVAL = float(os.getenv("CLUSTER_HEARTBEAT_INTERVAL", "5"))
+CLUSTER_HEARTBEAT_TIMEOUT = float(os.getenv("CLUSTER_HEARTBEAT_TIMEOUT", "60"))
+CLUSTER_DRAIN_TIMEOUT = float(os.getenv("CLUSTER_DRAIN_TIMEOUT", "60"))
+CLUSTER_HEALTH_HOST = os.getenv("CLUSTER_HEALTH_HOST", "127.0.0.1")
+CLUSTER_HEALTH_PORT = int(os.getenv("CLUSTER_HEALTH_PORT", "9180"))   # 0 - без HTTP проверки
+STT_SERVICE_TIMEOUT = float(os.getenv("STT_SERVICE_TIMEOUT", "300"))
+# Собирать FAQ индекс в этом процессе (воркеры кластера берут готовый с диска)
+FAQ_BUILD = os.getenv("FAQ_BUILD", "1") == "1"
+
 if not GIGACHAT_API_KEY:
     raise ValueError("Не найден GIGACHAT_API_KEY в .env файле")
 if not TELEGRAM_BOT_TOKEN:
-    raise ValueError("Не найден TELEGRAM_BOT_TOKEN в .env файле")
\ No newline at end of file
+    raise ValueError("Не найден TELEGRAM_BOT_TOKEN в .env файле")
+if CHAT_HISTORY_LIMIT < 0:
+    raise ValueError("CHAT_HISTORY_LIMIT не может быть отрицательным (0 - без истории)")
+if BOT_MODE == "webhook" and WEBHOOK_BASE_URL and not WEBHOOK_SECRET:
+    raise ValueError("Для режима webhook задайте WEBHOOK_SECRET в .env файле")
\ No newline at end of file
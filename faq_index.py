@@ -0,0 +1,260 @@
+import os
+import re
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from gigachat.models import Chat, Messages, MessagesRole
+
+import config
+import question_clustering as qc
+
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+
+# Короткие слова, которые меняют смысл вопроса (в признаки TF-IDF они не попадают)
+_NEGATIONS = frozenset({"не", "нет", "ни", "без", "кроме", "not", "no", "without", "except"})
+# Обращения и вежливые слова, без которых вопрос остаётся тем же
+_FILLER = frozenset({
+    "скажи", "скажите", "подскажи", "подскажите", "расскажи", "расскажите",
+    "объясни", "объясните", "назови", "назовите", "пожалуйста", "please", "tell",
+})
+STEM_LENGTH = 6   # слова сравниваем по началу, чтобы не мешали окончания
+
+_BLOCK_RE = re.compile(
+    r"ВОПРОС:\s*(?P<question>.+?)\s*\n\s*ВАРИАНТЫ:\s*(?P<variants>.*?)\s*\n\s*ОТВЕТ:\s*(?P<answer>.+?)"
+    r"(?=\n\s*ВОПРОС:|\Z)",
+    re.DOTALL,
+)
+
+
+# Значимые слова (по основам) и отрицания фразы
+def _terms(text: str) -> tuple:
+    words = qc.tokenize(text)
+    stems = frozenset(w[:STEM_LENGTH] for w in words if qc.is_significant(w) and w not in _FILLER)
+    return stems, _NEGATIONS.intersection(words)
+
+
+def _parse_faq(text: str) -> list:
+    entries = []
+    for match in _BLOCK_RE.finditer(text.replace("**", "")):
+        variants = [v.strip() for v in match.group("variants").split("|") if v.strip()]
+        entries.append({
+            "question": match.group("question").strip(),
+            "variants": variants,
+            "answer": match.group("answer").strip(),
+        })
+    return entries
+
+
+class FaqIndex:
+    """
+    Заранее подготовленные ответы на типичные вопросы по лекции.
+    Вопросы и ответы генерирует GigaChat в фоне после загрузки лекции, поиск идёт локально
+    по TF-IDF векторам (как в кластеризации вопросов). Близости мало: все значимые слова вопроса
+    должны встречаться в формулировках записи, а отрицания - совпадать, иначе вопрос уходит в GigaChat.
+    Индекс привязан к хэшу промпта с лекцией и пересобирается, когда лекция меняется; файл индекса,
+    обновлённый другим процессом, подхватывается не чаще раза в FAQ_CHECK_INTERVAL.
+    """
+
+    def __init__(self, path: str = None, threshold: float = None, size: int = None):
+        """
+        Args:
+            path: файл, где хранится индекс между запусками
+            threshold: минимальная косинусная близость для ответа из индекса
+            size: сколько вопросов просить у GigaChat
+        """
+        self.path = Path(path or config.FAQ_INDEX_PATH)
+        self.threshold = threshold if threshold is not None else config.FAQ_THRESHOLD
+        self.size = size or config.FAQ_SIZE
+
+        self._lock = threading.Lock()
+        self._target_hash = None   # лекция, под которую нужен индекс
+        self._hash = None          # лекция, под которую построен текущий индекс
+        self._entries = []
+        self._vectors = None       # строки - вопросы и их варианты
+        self._owners = None        # строка матрицы -> номер записи
+        self._idf = None
+        self._entry_stems = []     # номер записи -> значимые слова всех её формулировок
+        self._negations = []       # строка матрицы -> отрицания формулировки
+        self._mtime = None         # версия файла индекса, которую уже видели
+        self._checked = 0.0
+        self._done = threading.Event()   # загрузка или сборка последнего start() завершилась
+
+    @property
+    def ready(self) -> bool:
+        return self._hash is not None and self._hash == self._target_hash
+
+    def start(self, client, lecture_text: str, lecture_hash: str, build: bool = True):
+        """
+        Поднять индекс с диска или, если лекция изменилась, собрать новый в фоновом потоке
+
+        Args:
+            build: собирать ли индекс, если на диске нет подходящего
+        """
+        self._done.clear()
+        with self._lock:
+            self._target_hash = lecture_hash
+        if self._load(lecture_hash):
+            logger.info(f"FAQ индекс загружен: {len(self._entries)} вопросов")
+            self._done.set()
+            return
+        if not build:
+            logger.info("FAQ индекса для этой лекции на диске нет - работаем без него")
+            self._done.set()
+            return
+
+        thread = threading.Thread(target=self._build, args=(client, lecture_text, lecture_hash),
+                                  name="faq-index", daemon=True)
+        thread.start()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._done.wait(timeout)
+
+    def lookup(self, question: str):
+        """
+        Ответ из индекса, если вопрос достаточно похож на один из подготовленных
+
+        Returns:
+            (запись FAQ, близость) или None
+        """
+        self._reload_if_changed()
+        with self._lock:
+            if not self.ready or self._vectors is None:
+                return None
+            vectors, owners, idf, entries = self._vectors, self._owners, self._idf, self._entries
+            entry_stems, negations = self._entry_stems, self._negations
+
+        query = qc.vectorize([question], idf)[0]
+        if not query.any():
+            return None
+        scores = vectors @ query
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+
+        # "Какие правила спикер НЕ ввёл?" близок к "Какие правила ввёл спикер?", но ответ другой
+        owner = owners[best]
+        stems, query_negations = _terms(question)
+        if query_negations != negations[best] or not stems <= entry_stems[owner]:
+            return None
+        return entries[owner], float(scores[best])
+
+    def _reload_if_changed(self):
+        now = time.monotonic()
+        if now - self._checked < config.FAQ_CHECK_INTERVAL:
+            return
+        self._checked = now
+        try:
+            mtime = self.path.stat().st_mtime
+        except OSError:
+            return
+        if mtime == self._mtime or self._target_hash is None:
+            return
+        self._mtime = mtime
+        if self._load(self._target_hash):
+            logger.info(f"FAQ индекс обновлён с диска: {len(self._entries)} вопросов")
+
+    def _load(self, lecture_hash: str) -> bool:
+        if not self.path.exists():
+            return False
+        try:
+            self._mtime = self.path.stat().st_mtime
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Не удалось прочитать FAQ индекс {self.path}: {e}")
+            return False
+        if data.get("version") != INDEX_VERSION or data.get("lecture_hash") != lecture_hash:
+            return False
+        self._install(data["entries"], lecture_hash)
+        return True
+
+    def _save(self, entries: list, lecture_hash: str):
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": INDEX_VERSION, "lecture_hash": lecture_hash, "entries": entries},
+                      f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+        self._mtime = self.path.stat().st_mtime
+
+    def _install(self, entries: list, lecture_hash: str):
+        phrases, owners, entry_stems, negations = [], [], [], []
+        for i, entry in enumerate(entries):
+            stems = set()
+            for phrase in [entry["question"], *entry["variants"]]:
+                phrase_stems, phrase_negations = _terms(phrase)
+                stems |= phrase_stems
+                phrases.append(phrase)
+                owners.append(i)
+                negations.append(phrase_negations)
+            entry_stems.append(stems)
+
+        vectors = idf = None
+        if phrases:
+            tf = qc.term_frequencies(phrases)
+            idf = qc.idf_weights(qc.document_frequencies(tf), len(phrases))
+            vectors = qc.normalize(tf * idf)
+
+        with self._lock:
+            if lecture_hash != self._target_hash:
+                return
+            self._entries = entries
+            self._vectors = vectors
+            self._owners = np.asarray(owners)
+            self._idf = idf
+            self._entry_stems = entry_stems
+            self._negations = negations
+            self._hash = lecture_hash
+
+    def _build(self, client, lecture_text: str, lecture_hash: str):
+        try:
+            self._build_entries(client, lecture_text, lecture_hash)
+        finally:
+            self._done.set()
+
+    def _build_entries(self, client, lecture_text: str, lecture_hash: str):
+        logger.info("Собираем FAQ индекс по лекции...")
+        system_content = f"""Ты готовишь ответы на частые вопросы слушателей лекции. Используй ТОЛЬКО текст лекции ниже.
+
+ТЕКСТ ЛЕКЦИИ:
+----------------------------------------
+{lecture_text}
+----------------------------------------
+
+Составь {self.size} самых вероятных вопросов слушателей (главный вывод, ключевые правила и тезисы, как применить идеи на практике и т.п.).
+Для каждого вопроса дай 2-3 других формулировки того же вопроса и короткий ответ строго по лекции.
+Не используй двойные звездочки (**). Формат каждого блока строго такой:
+ВОПРОС: <вопрос>
+ВАРИАНТЫ: <формулировка 1> | <формулировка 2> | <формулировка 3>
+ОТВЕТ: <ответ>"""
+
+        messages = [
+            Messages(role=MessagesRole.SYSTEM, content=system_content),
+            Messages(role=MessagesRole.USER, content="Подготовь вопросы и ответы."),
+        ]
+        try:
+            response = client.chat(Chat(messages=messages))
+            entries = _parse_faq(response.choices[0].message.content)
+        except Exception as e:
+            logger.error(f"Не удалось собрать FAQ индекс: {e}")
+            return
+
+        if not entries:
+            logger.warning("GigaChat не вернул вопросов в нужном формате - FAQ индекс пуст")
+            return
+        if lecture_hash != self._target_hash:
+            logger.info("Лекция сменилась, пока собирался FAQ индекс - результат отброшен")
+            return
+
+        self._install(entries, lecture_hash)
+        try:
+            self._save(entries, lecture_hash)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить FAQ индекс {self.path}: {e}")
+        logger.info(f"FAQ индекс готов: {len(entries)} вопросов")
@@ -0,0 +1,21 @@
+from typing import Any, Dict, Optional, Union
+
+from gigachat import GigaChat
+from gigachat.api import post_chat
+from gigachat.models import Chat, ChatCompletion
+
+
+class SessionGigaChat(GigaChat):
+    """
+    Клиент GigaChat, который передаёт заголовок X-Session-ID.
+    Запросы с одним идентификатором сессии попадают на один сервер, и он
+    переиспользует уже обработанный префикс промпта (системное сообщение с лекцией).
+    """
+
+    def chat(self, payload: Union[Chat, Dict[str, Any]], session_id: Optional[str] = None) -> ChatCompletion:
+        chat = Chat.parse_obj(payload)
+        if self._settings.model:
+            chat.model = self._settings.model
+        return self._decorator(
+            lambda: post_chat.sync(self._client, chat=chat, access_token=self.token, session_id=session_id)
+        )
@@ -0,0 +1,225 @@
+import time
+import logging
+import threading
+from bisect import bisect_left
+from collections import deque
+from contextlib import nullcontext
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+import config
+
+
+logger = logging.getLogger(__name__)
+
+ENABLED = config.METRICS_ENABLED
+
+# Границы корзин гистограммы, секунды
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+RESERVOIR_SIZE = 2048   # Последние замеры этапа для p50/p95/p99 в /stats
+
+# Один объект на все выключенные таймеры - почти нулевые накладные расходы
+_NULL_TIMER = nullcontext()
+_lock = threading.Lock()
+
+
+class _Stage:
+    __slots__ = ("buckets", "total", "count", "recent")
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=RESERVOIR_SIZE)
+
+
+_stages = {}     # этап -> _Stage
+_counters = {}   # (имя, (метки...)) -> значение
+
+
+def observe(stage: str, seconds: float):
+    if not ENABLED:
+        return
+    with _lock:
+        data = _stages.get(stage)
+        if data is None:
+            data = _stages[stage] = _Stage()
+        data.buckets[bisect_left(BUCKETS, seconds)] += 1
+        data.total += seconds
+        data.count += 1
+        data.recent.append(seconds)
+
+
+def inc(name: str, value: float = 1, **labels):
+    if not ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+class _Timer:
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.stage, time.perf_counter() - self.started)
+        if exc_type is not None:
+            inc("errors_total", stage=self.stage)
+        return False
+
+
+# Замер длительности этапа: with metrics.timer("stt_inference"): ...
+def timer(stage: str):
+    if not ENABLED:
+        return _NULL_TIMER
+    return _Timer(stage)
+
+
+def _quantile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(q * len(values)))
+    return values[index]
+
+
+# Снимок этапов для /stats: число замеров, среднее и квантили
+def snapshot() -> dict:
+    with _lock:
+        stages = {name: (data.count, data.total, sorted(data.recent)) for name, data in _stages.items()}
+        counters = dict(_counters)
+
+    result = {"stages": {}, "counters": counters}
+    for name, (count, total, recent) in stages.items():
+        result["stages"][name] = {
+            "count": count,
+            "avg": total / count if count else 0.0,
+            "p50": _quantile(recent, 0.50),
+            "p95": _quantile(recent, 0.95),
+            "p99": _quantile(recent, 0.99),
+        }
+    return result
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+# Сырые данные гистограмм и счётчиков: в режиме кластера воркеры отправляют их фронту
+def export() -> dict:
+    with _lock:
+        return {
+            "stages": {name: (list(data.buckets), data.total, data.count) for name, data in _stages.items()},
+            "counters": dict(_counters),
+        }
+
+
+# Сумма данных нескольких процессов (корзины гистограмм у всех одинаковые)
+def merge(exports: list) -> dict:
+    stages, counters = {}, {}
+    for data in exports:
+        for name, (buckets, total, count) in data["stages"].items():
+            merged = stages.setdefault(name, ([0] * len(buckets), 0.0, 0))
+            stages[name] = ([a + b for a, b in zip(merged[0], buckets)], merged[1] + total, merged[2] + count)
+        for key, value in data["counters"].items():
+            counters[key] = counters.get(key, 0) + value
+    return {"stages": stages, "counters": counters}
+
+
+# Текст в формате Prometheus (по умолчанию - замеры этого процесса)
+def render_prometheus(data: dict = None) -> str:
+    if data is None:
+        data = export()
+    prefix = config.METRICS_PREFIX
+    lines = [
+        f"# HELP {prefix}_stage_seconds Длительность этапов обработки",
+        f"# TYPE {prefix}_stage_seconds histogram",
+    ]
+    for stage, (buckets, total, count) in sorted(data["stages"].items()):
+        cumulative = 0
+        for bound, bucket in zip(BUCKETS + (float("inf"),), buckets):
+            cumulative += bucket
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f"{prefix}_stage_seconds_bucket{_labels([('stage', stage), ('le', le)])} {cumulative}")
+        lines.append(f"{prefix}_stage_seconds_sum{_labels([('stage', stage)])} {total}")
+        lines.append(f"{prefix}_stage_seconds_count{_labels([('stage', stage)])} {count}")
+
+    counters = data["counters"]
+    names = sorted({name for name, _ in counters})
+    for name in names:
+        lines.append(f"# TYPE {prefix}_{name} counter")
+        for (counter, labels), value in sorted(counters.items()):
+            if counter == name:
+                lines.append(f"{prefix}_{name}{_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# Текст для команды /stats
+def format_stats() -> str:
+    if not ENABLED:
+        return "Метрики выключены (METRICS_ENABLED=0)"
+
+    data = snapshot()
+    if not data["stages"]:
+        return "Пока нет замеров"
+
+    lines = ["Этап: кол-во | p50 / p95 / p99, мс"]
+    for stage, values in sorted(data["stages"].items()):
+        lines.append(
+            f"{stage}: {values['count']} | "
+            f"{values['p50'] * 1000:.0f} / {values['p95'] * 1000:.0f} / {values['p99'] * 1000:.0f}"
+        )
+
+    if data["counters"]:
+        lines.append("")
+        for (name, labels), value in sorted(data["counters"].items()):
+            label_text = ", ".join(f"{key}={val}" for key, val in labels)
+            lines.append(f"{name}{f' ({label_text})' if label_text else ''}: {value:g}")
+    return "\n".join(lines)
+
+
+# Время обработки каждого входящего обновления (от получения до конца хендлера)
+class UpdateTimingMiddleware(BaseMiddleware):
+    async def __call__(self, handler, event, data):
+        update_type = getattr(event, "event_type", "unknown")
+        inc("updates_total", type=update_type)
+        with timer(f"update_{update_type}"):
+            return await handler(event, data)
+
+
+# Время каждого запроса к Bot API (отправка, редактирование, загрузка файлов)
+class TelegramTimingMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request, bot, method):
+        api_method = getattr(method, "__api_method__", type(method).__name__)
+        inc("telegram_requests_total", method=api_method)
+        with timer(f"telegram_{api_method}"):
+            return await make_request(bot, method)
+
+
+# Локальный HTTP сервер с /metrics для Prometheus (render - откуда брать текст, например сумма по кластеру)
+async def start_http_server(host: str, port: int, render=render_prometheus):
+    from aiohttp import web
+
+    async def handle_metrics(request):
+        return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,207 @@
+import re
+import zlib
+
+import numpy as np
+
+
+N_FEATURES = 1024          # Размерность хэшированных признаков
+SELECTION_SAMPLE = 3000    # На скольких вопросах подбираем число кластеров
+MAX_CLUSTERS = 12
+MAX_ITER = 50
+
+_WORD_RE = re.compile(r"[a-zа-яё0-9]+")
+_STOP_WORDS = {
+    "как", "что", "это", "для", "или", "при", "все", "так", "его", "они", "вас",
+    "нас", "там", "где", "когда", "какие", "какой", "какая", "каким", "почему",
+    "зачем", "ли", "чем", "есть", "будет", "можно", "нужно", "если", "the",
+    "and", "for", "what", "how", "why", "спикер", "спикера", "вопрос",
+}
+
+# Кэш хэшей признаков: словарь вопросов сильно повторяется
+_feature_cache = {}
+
+
+def _features(word: str) -> list:
+    cached = _feature_cache.get(word)
+    if cached is not None:
+        return cached
+
+    # Слово целиком (с грубым стеммингом) + символьные триграммы для устойчивости к словоформам
+    grams = ["w:" + word[:6]]
+    padded = f"<{word}>"
+    grams.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    cached = [zlib.crc32(gram.encode("utf-8")) % N_FEATURES for gram in grams]
+
+    if len(_feature_cache) < 200000:
+        _feature_cache[word] = cached
+    return cached
+
+
+# Слова текста в нижнем регистре, ё -> е
+def tokenize(text: str) -> list:
+    return _WORD_RE.findall(text.lower().replace('ё', 'е'))
+
+
+# Слова, которые идут в признаки: без коротких и служебных
+def is_significant(word: str) -> bool:
+    return len(word) >= 3 and word not in _STOP_WORDS
+
+
+# Хэшированная матрица частот признаков (строки - вопросы), сублинейный tf
+def term_frequencies(texts: list) -> np.ndarray:
+    rows, cols = [], []
+    for row, text in enumerate(texts):
+        for word in tokenize(text):
+            if not is_significant(word):
+                continue
+            features = _features(word)
+            cols.extend(features)
+            rows.extend([row] * len(features))
+
+    matrix = np.zeros((len(texts), N_FEATURES), dtype=np.float32)
+    if rows:
+        np.add.at(matrix, (np.asarray(rows), np.asarray(cols)), 1.0)
+    np.log1p(matrix, out=matrix)
+    return matrix
+
+
+# Частота документов по признакам (для idf)
+def document_frequencies(tf: np.ndarray) -> np.ndarray:
+    return (tf > 0).sum(axis=0).astype(np.float64)
+
+
+def idf_weights(df: np.ndarray, n_docs: int) -> np.ndarray:
+    return (np.log((1.0 + n_docs) / (1.0 + df)) + 1.0).astype(np.float32)
+
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+# TF-IDF векторы вопросов, нормированные по L2
+def vectorize(texts: list, idf: np.ndarray = None) -> np.ndarray:
+    tf = term_frequencies(texts)
+    if idf is None:
+        idf = idf_weights(document_frequencies(tf), len(texts))
+    return normalize(tf * idf)
+
+
+def _init_centroids(X: np.ndarray, k: int, rng) -> np.ndarray:
+    # k-means++: каждый следующий центр выбираем с вероятностью, пропорциональной расстоянию
+    centroids = [X[rng.integers(len(X))]]
+    closest = 1.0 - X @ centroids[0]
+    for _ in range(1, k):
+        weights = np.clip(closest, 0, None)
+        total = weights.sum()
+        if total <= 0:
+            index = rng.integers(len(X))
+        else:
+            index = rng.choice(len(X), p=weights / total)
+        centroids.append(X[index])
+        closest = np.minimum(closest, 1.0 - X @ X[index])
+    return np.array(centroids)
+
+
+def kmeans(X: np.ndarray, k: int, seed: int = 0, max_iter: int = MAX_ITER) -> tuple:
+    """
+    Сферический k-means (по косинусной близости) для L2-нормированных векторов
+
+    Returns:
+        (метки кластеров, нормированные центроиды)
+    """
+    rng = np.random.default_rng(seed)
+    centroids = _init_centroids(X, k, rng)
+    labels = np.full(len(X), -1)
+    clusters = np.arange(k)
+
+    for _ in range(max_iter):
+        new_labels = np.argmax(X @ centroids.T, axis=1)
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+
+        # Суммы по кластерам одним матричным умножением (np.add.at по строкам на порядок медленнее)
+        one_hot = (labels[:, None] == clusters[None, :]).astype(X.dtype)
+        sums = one_hot.T @ X
+        empty = np.linalg.norm(sums, axis=1) == 0
+        # Пустой кластер перезапускаем на самом "далёком" вопросе
+        if empty.any():
+            far = np.argsort(np.max(X @ centroids.T, axis=1))[:empty.sum()]
+            sums[empty] = X[far]
+        centroids = normalize(sums)
+
+    return labels, centroids
+
+
+def silhouette(X: np.ndarray, labels: np.ndarray) -> float:
+    """
+    Средний силуэт по косинусному расстоянию
+    """
+    clusters = np.unique(labels)
+    if len(clusters) < 2:
+        return -1.0
+
+    distances = 1.0 - X @ X.T
+    one_hot = (labels[:, None] == clusters[None, :]).astype(np.float32)
+    sizes = one_hot.sum(axis=0)
+    mean_dist = (distances @ one_hot)
+
+    own = np.searchsorted(clusters, labels)
+    own_size = sizes[own]
+    a = mean_dist[np.arange(len(X)), own] / np.maximum(own_size - 1, 1)
+    mean_dist /= sizes
+    mean_dist[np.arange(len(X)), own] = np.inf
+    b = mean_dist.min(axis=1)
+
+    scores = (b - a) / np.maximum(np.maximum(a, b), 1e-9)
+    scores[own_size <= 1] = 0.0
+    return float(scores.mean())
+
+
+def choose_k(X: np.ndarray, max_clusters: int = MAX_CLUSTERS, seed: int = 0) -> int:
+    """
+    Подбираем число кластеров по силуэту на случайной подвыборке
+    """
+    n = len(X)
+    if n < 4:
+        return 1
+
+    rng = np.random.default_rng(seed)
+    sample = X if n <= SELECTION_SAMPLE else X[rng.choice(n, SELECTION_SAMPLE, replace=False)]
+
+    upper = min(max_clusters, max(2, int(np.sqrt(len(sample) / 2))), len(sample) - 1)
+    best_k, best_score = 1, -1.0
+    for k in range(2, upper + 1):
+        labels, _ = kmeans(sample, k, seed=seed)
+        score = silhouette(sample, labels)
+        if score > best_score:
+            best_k, best_score = k, score
+    return best_k
+
+
+# Распределяем проценты (с точностью 0.1) так, чтобы сумма была ровно 100
+def percentages(counts: list) -> list:
+    total = sum(counts)
+    if not total:
+        return [0.0 for _ in counts]
+
+    scaled = [count * 1000 / total for count in counts]
+    floors = [int(value) for value in scaled]
+    rest = 1000 - sum(floors)
+    order = sorted(range(len(counts)), key=lambda i: scaled[i] - floors[i], reverse=True)
+    for i in order[:rest]:
+        floors[i] += 1
+    return [value / 10 for value in floors]
+
+
+def representatives(X: np.ndarray, labels: np.ndarray, centroids: np.ndarray, cluster: int,
+                    limit: int) -> list:
+    """
+    Индексы вопросов кластера, ближайших к его центру
+    """
+    members = np.flatnonzero(labels == cluster)
+    similarity = X[members] @ centroids[cluster]
+    return members[np.argsort(-similarity)[:limit]].tolist()
+
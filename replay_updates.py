@@ -0,0 +1,93 @@
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+import aiohttp
+
+
+# Локальная проверка webhook: отправляет записанные обновления (JSONL) на сервер бота
+# Пример: python replay_updates.py updates.jsonl --url http://127.0.0.1:8080/webhook --secret ... --rate 200
+
+def load_updates(path: str) -> list:
+    updates = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                updates.append(json.loads(line))
+    return updates
+
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+async def replay(updates: list, url: str, secret: str, rate: float, concurrency: int, repeat: int):
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, statuses = [], {}
+    next_update_id = max((u.get("update_id", 0) for u in updates), default=0) + 1
+
+    async def send(session, payload):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                async with session.post(url, json=payload, headers=headers) as response:
+                    await response.read()
+                    status = response.status
+            except aiohttp.ClientError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        tasks = []
+        for i in range(repeat):
+            for update in updates:
+                payload = dict(update)
+                # При повторах выдаём новые update_id, как это делал бы Telegram
+                if i:
+                    payload["update_id"] = next_update_id
+                    next_update_id += 1
+                tasks.append(asyncio.create_task(send(session, payload)))
+                if rate > 0:
+                    await asyncio.sleep(1 / rate)
+        await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    total = len(latencies)
+    print(f"Отправлено обновлений: {total} за {elapsed:.2f} с ({total / elapsed:.1f} в секунду)")
+    print(f"Ответы сервера: {statuses}")
+    print("Задержка ответа, мс: "
+          f"p50={percentile(latencies, 50) * 1000:.1f} "
+          f"p95={percentile(latencies, 95) * 1000:.1f} "
+          f"p99={percentile(latencies, 99) * 1000:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Отправка записанных обновлений Telegram на webhook бота")
+    parser.add_argument("updates", help="файл JSONL с обновлениями (по одному Update на строку)")
+    parser.add_argument("--url", default="http://127.0.0.1:8080/webhook")
+    parser.add_argument("--secret", default="", help="значение X-Telegram-Bot-Api-Secret-Token")
+    parser.add_argument("--rate", type=float, default=0, help="обновлений в секунду (0 - без ограничения)")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=1, help="сколько раз прогнать файл")
+    args = parser.parse_args()
+
+    updates = load_updates(args.updates)
+    if not updates:
+        print("Файл обновлений пуст")
+        sys.exit(1)
+
+    asyncio.run(replay(updates, args.url, args.secret, args.rate, args.concurrency, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import os
+import hashlib
+import logging
+import shutil
+import tempfile
+from pathlib import Path
+
+import config
+
+
+logger = logging.getLogger(__name__)
+
+REPORT_EXT = ".pdf"
+
+
+# Считаем ключ кэша: хэш содержимого входных документов + версия промпта + модель
+def make_key(file_paths: list, prompt_version: str, model: str) -> str:
+    digest = hashlib.sha256()
+    digest.update(f"prompt={prompt_version}\nmodel={model}\n".encode("utf-8"))
+
+    for path in file_paths:
+        path = Path(path)
+        digest.update(f"file={path.name}\n".encode("utf-8"))
+        if not path.exists():
+            digest.update(b"<missing>")
+            continue
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def _cache_path(key: str) -> Path:
+    return Path(config.REPORT_CACHE_DIR) / f"{key}{REPORT_EXT}"
+
+
+# Возвращаем путь к готовому отчёту из кэша или None
+def get(key: str):
+    path = _cache_path(key)
+    if not path.exists():
+        return None
+
+    # Обновляем время доступа, чтобы вытеснялись самые старые отчёты
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+
+    logger.info(f"Отчёт найден в кэше: {path.name}")
+    return str(path)
+
+
+# Кладём готовый отчёт в кэш и возвращаем путь к нему
+def put(key: str, report_path: str) -> str:
+    cache_dir = Path(config.REPORT_CACHE_DIR)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    path = _cache_path(key)
+
+    # Копируем через временный файл, чтобы в кэше не оказалось недописанного PDF
+    fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=cache_dir)
+    os.close(fd)
+    try:
+        shutil.copyfile(report_path, tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+    logger.info(f"Отчёт сохранён в кэш: {path.name}")
+    evict(keep=path)
+    return str(path)
+
+
+# Удаляем самые давно использованные отчёты, пока кэш не уложится в лимит
+def evict(max_bytes: int = None, keep: Path = None):
+    if max_bytes is None:
+        max_bytes = config.REPORT_CACHE_MAX_BYTES
+
+    cache_dir = Path(config.REPORT_CACHE_DIR)
+    if not cache_dir.exists():
+        return
+
+    entries = []
+    for path in cache_dir.glob(f"*{REPORT_EXT}"):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    entries.sort()
+
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        if keep is not None and path == keep:
+            continue
+        try:
+            path.unlink()
+            total -= size
+            logger.info(f"Отчёт вытеснен из кэша: {path.name}")
+        except OSError as e:
+            logger.warning(f"Не удалось удалить отчёт из кэша {path}: {e}")
@@ -0,0 +1,304 @@
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods.base import TelegramMethod
+
+import config
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты: ответы пользователям уходят раньше сообщений о ходе обработки
+FINAL = 0
+PROGRESS = 1
+
+
+class TokenBucket:
+    """
+    Ведро токенов: rate токенов в секунду, не больше burst про запас
+    """
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    # Через сколько секунд будет доступен токен (0 - уже есть)
+    def delay(self, now: float) -> float:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class _Item:
+    __slots__ = ("priority", "seq", "method", "future", "merge_key", "enqueued", "attempts")
+
+    def __lt__(self, other: "_Item") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class _Chat:
+    __slots__ = ("bucket", "heap", "busy", "paused_until")
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self.heap = []
+        self.busy = False
+        self.paused_until = 0.0
+
+
+class SendQueue:
+    """
+    Очередь исходящих запросов к Bot API. Соблюдает общий лимит и лимит каждого чата,
+    пережидает 429 (retry after), склеивает идущие подряд правки одного сообщения
+    и отправляет финальные ответы раньше промежуточных. В одном чате одновременно
+    выполняется не больше одного запроса, поэтому порядок внутри приоритета сохраняется.
+    Промежуточное сообщение, прождавшее progress_max_wait, идёт наравне с ответами:
+    иначе в занятой группе оно (и цепочка правок за ним) ждало бы, пока не кончатся ответы.
+    """
+
+    def __init__(self, global_rate: float, private_rate: float, group_rate: float,
+                 chat_burst: int, max_retries: int, progress_max_wait: float):
+        """
+        Args:
+            global_rate: запросов в секунду на всего бота
+            private_rate: запросов в секунду в один личный чат
+            group_rate: запросов в секунду в одну группу
+            chat_burst: сколько запросов в чат можно отправить подряд без ожидания
+            max_retries: сколько раз повторять запрос после retry after
+            progress_max_wait: через сколько секунд PROGRESS получает приоритет FINAL
+        """
+        self.private_rate = private_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.progress_max_wait = progress_max_wait
+
+        self._global = TokenBucket(global_rate, max(1, int(global_rate)))
+        self._chats = {}    # chat_id -> _Chat
+        self._merge = {}    # (chat_id, message_id) -> ещё не отправленная правка/удаление
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._task = None
+        self._sending = set()
+
+    def submit(self, method: TelegramMethod, priority: int = FINAL) -> asyncio.Future:
+        """
+        Поставить запрос в очередь. Ждать результата не обязательно: ошибки попадут в лог.
+        Правка или удаление сообщения, которое ещё ждёт своей правки, заменяет её.
+
+        Args:
+            method: запрос, привязанный к боту (message.reply(...), msg.edit_text(...) и т.п.)
+            priority: FINAL или PROGRESS
+
+        Returns:
+            Future с результатом запроса
+        """
+        chat_id = method.chat_id
+        message_id = getattr(method, "message_id", None)
+        merge_key = (chat_id, message_id) if message_id is not None else None
+
+        pending = self._merge.get(merge_key) if merge_key else None
+        if pending is not None:
+            pending.method = method
+            if priority < pending.priority:
+                pending.priority = priority
+                heapq.heapify(self._chats[chat_id].heap)
+            metrics.inc("send_merged_total")
+            return pending.future
+
+        item = _Item()
+        item.priority = priority
+        item.seq = next(self._seq)
+        item.method = method
+        item.future = asyncio.get_running_loop().create_future()
+        item.future.add_done_callback(_log_failure)
+        item.merge_key = merge_key
+        item.enqueued = time.monotonic()
+        item.attempts = 0
+
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            rate = self.private_rate if chat_id > 0 else self.group_rate
+            chat = self._chats[chat_id] = _Chat(TokenBucket(rate, self.chat_burst))
+        heapq.heappush(chat.heap, item)
+        if merge_key:
+            self._merge[merge_key] = item
+
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        self._wakeup.set()
+        return item.future
+
+    def submit_after(self, future: asyncio.Future, make_method, priority: int = FINAL,
+                     fallback: TelegramMethod = None):
+        """
+        Поставить запрос, которому нужен результат ещё не отправленного (правка или удаление
+        сообщения о ходе обработки), не дожидаясь отправки первого
+
+        Args:
+            future: результат submit() первого запроса
+            make_method: функция от результата первого запроса (например, Message), возвращает запрос
+            priority: FINAL или PROGRESS
+            fallback: что отправить вместо этого, если первый запрос не удался
+        """
+        def on_done(done: asyncio.Future):
+            if not done.cancelled() and done.exception() is None:
+                self.submit(make_method(done.result()), priority)
+            elif fallback is not None:
+                self.submit(fallback, priority)
+
+        future.add_done_callback(on_done)
+
+    async def close(self, timeout: float = 30):
+        """
+        Дождаться отправки всего, что уже в очереди, и остановить очередь
+        """
+        if self._task is None:
+            return
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            futures = [item.future for chat in self._chats.values() for item in chat.heap]
+            futures.extend(self._sending)
+            if not futures:
+                break
+            await asyncio.wait(futures, timeout=deadline - time.monotonic())
+
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            chosen = None
+            wait = None
+            idle = []
+
+            # Из чатов, где уже можно отправлять, берём запрос с наивысшим приоритетом
+            for chat_id, chat in self._chats.items():
+                if chat.busy:
+                    continue
+                ready_in = max(chat.paused_until - now, chat.bucket.delay(now))
+                if not chat.heap:
+                    if ready_in <= 0 and chat.bucket.tokens >= chat.bucket.burst:
+                        idle.append(chat_id)
+                    continue
+                if ready_in > 0:
+                    wait = ready_in if wait is None else min(wait, ready_in)
+                    continue
+                self._promote(chat, now)
+                if chosen is None or chat.heap[0] < chosen[1].heap[0]:
+                    chosen = (chat_id, chat)
+
+            for chat_id in idle:
+                del self._chats[chat_id]
+
+            if chosen is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            global_wait = self._global.delay(now)
+            if global_wait > 0:
+                # Пока ждём общий лимит, мог прийти запрос важнее - выбираем заново
+                await asyncio.sleep(global_wait)
+                continue
+
+            chat_id, chat = chosen
+            self._global.take()
+            chat.bucket.take()
+            item = heapq.heappop(chat.heap)
+            if item.merge_key:
+                self._merge.pop(item.merge_key, None)
+            chat.busy = True
+            self._sending.add(item.future)
+            asyncio.create_task(self._send(chat, item))
+
+    def _promote(self, chat: _Chat, now: float):
+        waited_since = now - self.progress_max_wait
+        promoted = False
+        for item in chat.heap:
+            if item.priority > FINAL and item.enqueued <= waited_since:
+                item.priority = FINAL
+                promoted = True
+        if promoted:
+            heapq.heapify(chat.heap)
+
+    async def _send(self, chat: _Chat, item: _Item):
+        metrics.observe("send_queue_wait", time.monotonic() - item.enqueued)
+        try:
+            with metrics.timer("send_request"):
+                result = await item.method
+        except TelegramRetryAfter as e:
+            item.attempts += 1
+            metrics.inc("telegram_retry_after_total")
+            logger.warning(f"Лимит Telegram в чате {item.method.chat_id}: пауза {e.retry_after} с "
+                           f"(попытка {item.attempts})")
+            chat.paused_until = time.monotonic() + e.retry_after
+            if item.attempts > self.max_retries:
+                item.future.set_exception(e)
+            else:
+                self._retry(chat, item)
+        except Exception as e:
+            item.future.set_exception(e)
+        else:
+            item.future.set_result(result)
+        finally:
+            self._sending.discard(item.future)
+            chat.busy = False
+            self._wakeup.set()
+
+    def _retry(self, chat: _Chat, item: _Item):
+        newer = self._merge.get(item.merge_key) if item.merge_key else None
+        if newer is None:
+            heapq.heappush(chat.heap, item)
+            if item.merge_key:
+                self._merge[item.merge_key] = item
+            return
+
+        # Пока ждали, пришла более свежая правка того же сообщения - отправим только её
+        if item.priority < newer.priority:
+            newer.priority = item.priority
+            heapq.heapify(chat.heap)
+        newer.future.add_done_callback(lambda future: _copy_result(future, item.future))
+
+
+def _copy_result(source: asyncio.Future, target: asyncio.Future):
+    if target.done():
+        return
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
+def _log_failure(future: asyncio.Future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error(f"Не удалось отправить сообщение: {future.exception()}")
+
+
+send_queue = SendQueue(
+    global_rate=config.SEND_GLOBAL_RATE,
+    private_rate=config.SEND_PRIVATE_RATE,
+    group_rate=config.SEND_GROUP_RATE,
+    chat_burst=config.SEND_CHAT_BURST,
+    max_retries=config.SEND_MAX_RETRIES,
+    progress_max_wait=config.SEND_PROGRESS_MAX_WAIT,
+)
@@ -0,0 +1,182 @@
+import time
+import queue
+import sqlite3
+import logging
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_chat ON messages (chat_id, id);
+"""
+
+_STOP = object()
+
+
+class SessionStore:
+    """
+    Хранилище истории диалогов в SQLite (WAL). Запись отложенная: сообщения копятся в очереди
+    и пишутся пачками в фоновом потоке, поэтому ответ пользователю не ждёт fsync.
+    История чата читается с диска только при первом обращении к нему после перезапуска.
+    """
+
+    def __init__(self, path: str, history_limit: int, flush_interval: float = 0.5,
+                 compact_interval: float = 3600, batch_size: int = 500):
+        """
+        Args:
+            path: путь к файлу базы
+            history_limit: сколько последних сообщений чата хранить и поднимать при старте
+            flush_interval: как часто сбрасывать накопленные записи, с
+            compact_interval: как часто удалять старые сообщения сверх лимита, с
+            batch_size: максимум записей в одной транзакции
+        """
+        self.path = path
+        self.history_limit = history_limit
+        self.flush_interval = flush_interval
+        self.compact_interval = compact_interval
+        self.batch_size = batch_size
+
+        self._queue = queue.Queue()
+        self._read_lock = threading.Lock()
+        # Очистки, которые ещё не дошли до базы: chat_id (None - все чаты) -> сколько в очереди
+        self._pending_clears = {}
+        self._clears_lock = threading.Lock()
+        self._reader = self._connect()
+        self._reader.executescript(_SCHEMA)
+        self._thread = threading.Thread(target=self._writer, name="session-store", daemon=True)
+        self._thread.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        # В WAL режиме NORMAL не теряет целостность, fsync только на чекпоинтах
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def append(self, chat_id: int, role: str, content: str):
+        self._queue.put(("append", chat_id, role, content, time.time()))
+
+    def clear(self, chat_id: int = None):
+        with self._clears_lock:
+            self._pending_clears[chat_id] = self._pending_clears.get(chat_id, 0) + 1
+        self._queue.put(("clear", chat_id))
+
+    def load(self, chat_id: int) -> list:
+        """
+        Последние history_limit сообщений чата в виде (role, content), от старых к новым
+        """
+        # Очистка ещё в очереди: на диске старая история, а новая пока только в очереди
+        with self._clears_lock:
+            if chat_id in self._pending_clears or None in self._pending_clears:
+                return []
+        with self._read_lock:
+            rows = self._reader.execute(
+                "SELECT role, content FROM ("
+                "  SELECT id, role, content FROM messages WHERE chat_id = ? ORDER BY id DESC LIMIT ?"
+                ") ORDER BY id",
+                (chat_id, self.history_limit),
+            ).fetchall()
+        return rows
+
+    def flush(self, timeout: float = 10):
+        """
+        Дождаться записи всего, что уже поставлено в очередь
+        """
+        done = threading.Event()
+        self._queue.put(("flush", done))
+        done.wait(timeout)
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._thread.join(timeout=30)
+        with self._read_lock:
+            self._reader.close()
+
+    def _writer(self):
+        connection = self._connect()
+        last_compact = time.monotonic()
+        stopping = False
+
+        while not stopping:
+            batch = []
+            try:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+                # Забираем всё, что успело накопиться, одной транзакцией
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            if _STOP in batch:
+                stopping = True
+                batch = [item for item in batch if item is not _STOP]
+
+            try:
+                self._write_batch(connection, batch)
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка записи истории диалогов: {e}")
+
+            if time.monotonic() - last_compact >= self.compact_interval:
+                self._compact(connection)
+                last_compact = time.monotonic()
+
+        connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        connection.close()
+
+    def _write_batch(self, connection: sqlite3.Connection, batch: list):
+        flushed = []
+        try:
+            with connection:
+                for item in batch:
+                    kind = item[0]
+                    if kind == "append":
+                        connection.execute(
+                            "INSERT INTO messages (chat_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                            item[1:],
+                        )
+                    elif kind == "clear":
+                        if item[1] is None:
+                            connection.execute("DELETE FROM messages")
+                        else:
+                            connection.execute("DELETE FROM messages WHERE chat_id = ?", (item[1],))
+                    elif kind == "flush":
+                        flushed.append(item[1])
+        finally:
+            self._done_clears([item[1] for item in batch if item[0] == "clear"])
+        for done in flushed:
+            done.set()
+
+    def _done_clears(self, chat_ids: list):
+        with self._clears_lock:
+            for chat_id in chat_ids:
+                left = self._pending_clears.get(chat_id, 0) - 1
+                if left > 0:
+                    self._pending_clears[chat_id] = left
+                else:
+                    self._pending_clears.pop(chat_id, None)
+
+    def _compact(self, connection: sqlite3.Connection):
+        # Оставляем по history_limit последних сообщений на чат и укорачиваем WAL файл
+        try:
+            with connection:
+                deleted = connection.execute(
+                    "DELETE FROM messages WHERE id IN ("
+                    "  SELECT id FROM ("
+                    "    SELECT id, ROW_NUMBER() OVER (PARTITION BY chat_id ORDER BY id DESC) AS rn"
+                    "    FROM messages"
+                    "  ) WHERE rn > ?"
+                    ")",
+                    (self.history_limit,),
+                ).rowcount
+            connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            logger.info(f"Компакция истории диалогов: удалено сообщений {deleted}")
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка компакции истории диалогов: {e}")
@@ -1,27 +1,109 @@
 import os
+import asyncio
 import logging
 import tempfile
+import uuid
+import threading
 from pathlib import Path
+from multiprocessing.connection import wait
 import torch
 from transformers import pipeline
+from transformers.pipelines.audio_utils import ffmpeg_read
 import torchaudio
 import soundfile as sf
 
+import metrics
+
 
 logger = logging.getLogger(__name__)
 
 # Глобальная переменная для пайплайна (чтобы загрузить модель 1 раз)
 _asr_pipeline = None
+# Клиент общего STT сервиса: в режиме кластера модель живёт в отдельном процессе
+_service = None
 
 # Конфигурация модели
 WHISPER_MODEL = "openai/whisper-medium"  # "openai/whisper-base", "openai/whisper-large-v3" 
 DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 logger.info(f"STT будет использовать устройство: {DEVICE}")
 
+class _ServiceClient:
+    """
+    Клиент STT сервиса поверх канала multiprocessing (Pipe): запрос - (id, путь к файлу),
+    ответ - (id, текст). Ответы читает отдельный поток, поэтому запросы можно слать из разных потоков
+    """
+
+    def __init__(self, connection, timeout: float):
+        self.connection = connection
+        self.timeout = timeout
+        self._waiting = {}   # id запроса -> [Event, текст]
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        threading.Thread(target=self._read, name="stt-client", daemon=True).start()
+
+    def _read(self):
+        while True:
+            try:
+                request_id, text = self.connection.recv()
+            except (EOFError, OSError):
+                logger.error("Канал к STT сервису закрыт")
+                return
+            with self._lock:
+                slot = self._waiting.pop(request_id, None)
+            if slot is not None:
+                slot[1] = text
+                slot[0].set()
+
+    # None - сервис не ответил за timeout
+    def call(self, file_path):
+        request_id = uuid.uuid4().hex
+        slot = [threading.Event(), None]
+        with self._lock:
+            self._waiting[request_id] = slot
+        with self._send_lock:
+            self.connection.send((request_id, file_path))
+
+        if not slot[0].wait(self.timeout):
+            with self._lock:
+                self._waiting.pop(request_id, None)
+            logger.error(f"STT сервис не ответил за {self.timeout} с")
+            return None
+        return slot[1]
+
+# Переключаем модуль в режим клиента общего STT сервиса
+def connect_service(connection, timeout: float):
+    global _service
+    _service = _ServiceClient(connection, timeout)
+
+# Цикл STT сервиса: модель загружается один раз на все воркеры, запросы выполняются по очереди.
+# None в любом из каналов - остановка
+def serve(connections: list):
+    init_stt()
+    connections = list(connections)
+    while connections:
+        for connection in wait(connections):
+            try:
+                item = connection.recv()
+            except (EOFError, OSError):
+                connections.remove(connection)
+                continue
+            if item is None:
+                return
+            request_id, file_path = item
+            if file_path is None:
+                # Проверка готовности
+                text = "ready" if _asr_pipeline is not None else None
+            else:
+                text = transcribe_audio(file_path)
+            connection.send((request_id, text))
+
 # Инициализируем модель распознавания речи
 def init_stt():
     global _asr_pipeline
     
+    if _service is not None:
+        return _service.call(None) == "ready"
+    
     if _asr_pipeline is not None:
         logger.info("STT модель уже загружена")
         return True
@@ -47,6 +129,8 @@ def init_stt():
 def transcribe_audio(file_path: str) -> str:
     global _asr_pipeline
     
+    if _service is not None:
+        return _service.call(file_path) or ""
 
     if _asr_pipeline is None:
         if not init_stt():
@@ -59,15 +143,22 @@ def transcribe_audio(file_path: str) -> str:
         
         logger.info(f"Транскрибируем аудио: {file_path}")
         
+        # Декодируем сами (как это делает пайплайн), чтобы замерить декодирование отдельно от модели
+        with metrics.timer("audio_decode"):
+            sampling_rate = _asr_pipeline.feature_extractor.sampling_rate
+            with open(file_path, 'rb') as f:
+                audio = ffmpeg_read(f.read(), sampling_rate)
+        
         # Whisper 
-        result = _asr_pipeline(
-            file_path,
-            generate_kwargs={
-                "max_new_tokens": 256,  # Максимальная длина текста
-                "task": "transcribe",   
-            },
-            return_timestamps=False     
-        )
+        with metrics.timer("stt_inference"):
+            result = _asr_pipeline(
+                {"raw": audio, "sampling_rate": sampling_rate},
+                generate_kwargs={
+                    "max_new_tokens": 256,  # Максимальная длина текста
+                    "task": "transcribe",   
+                },
+                return_timestamps=False     
+            )
         
         # Извлекаем текст из результата
         transcribed_text = result.get("text", "").strip()
@@ -81,6 +172,13 @@ def transcribe_audio(file_path: str) -> str:
         logger.error(f"❌ Ошибка при транскрибации: {e}")
         return ""
 
+# То же для обработчиков: в режиме кластера ждём сервис, не блокируя event loop
+async def transcribe_audio_async(file_path: str) -> str:
+    if _service is None:
+        # Модель в этом процессе - как и раньше, распознаём прямо в потоке loop
+        return transcribe_audio(file_path)
+    return await asyncio.get_running_loop().run_in_executor(None, transcribe_audio, file_path)
+
 # Транскрибируем аудио из байтов
 def transcribe_audio_bytes(audio_bytes: bytes, file_ext: str = ".ogg") -> str:
 
@@ -9,20 +9,35 @@ from docx.shared import Inches
 from gigachat import GigaChat
 from gigachat.models import Chat, Messages, MessagesRole
 
+import metrics
+import usage
+from topic_analyzer import TopicAnalyzer, read_questions
+
+
+# Версия промпта отчёта: меняем при правке промпта, чтобы сбросить кэш отчётов
+PROMPT_VERSION = "3"
+
 
 class Summarizer:
     """
     Класс для создания отчёта по конференции с использованием GigaChat
     """
 
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, model: str = "GigaChat", chat_id: int = 0, user_id: int = 0):
         """
         Инициализация с использование библиотеки gigachat
 
         Args:
             api_key: Api ключ для доступа к GC
+            model: модель GC для создания отчёта
+            chat_id: чат, на который записывается расход токенов
+            user_id: пользователь, запросивший отчёт
         """
-        self.client = GigaChat(credentials=api_key, verify_ssl_certs=False)
+        self.model = model
+        self.client = usage.MeteredClient(
+            GigaChat(credentials=api_key, model=model, verify_ssl_certs=False),
+            usage.tracker, command="report", chat_id=chat_id, user_id=user_id
+        )
 
     def read_docx(self, file_path: str) -> str:
         """
@@ -105,6 +120,86 @@ class Summarizer:
 
         return self._parse_response(raw_response)
 
+    def get_summary_with_topics(self, conf_text: str, topics: list) -> str:
+        """
+            Отправка запроса в GC, когда темы вопросов уже посчитаны локально.
+            В GC уходит только речь спикера и готовая статистика по темам, а не все вопросы.
+        """
+        system_content = """Ты — ассистент для глубокого анализа конференций. Тебе даны расшифровка выступления спикера и уже посчитанная статистика по темам вопросов участников (Q&A). Подготовь структурированный отчёт из двух частей.
+
+**Часть 1. Краткая выжимка из речи спикера.**
+Сделай лаконичное, но содержательное резюме основной части выступления. Выдели ключевые темы, основные мысли и выводы, которые озвучил спикер. Избегай общих фраз, сконцентрируйся на сути.
+
+**Часть 2. Аналитика вопросов участников (самое важное!).**
+Темы, количество вопросов и проценты уже посчитаны — используй их ТОЧНО как даны, ничего не пересчитывай и не придумывай новых тем.
+1. Опиши основные тенденции: какие темы больше всего волновали участников и в какой доле.
+2. Для каждой темы приведи 1-2 наиболее показательных примера вопросов из статистики и ответы на них, если они даны.
+3. Представь эту часть в виде связного аналитического текста.
+
+**ВАЖНО:**
+- Не пиши код и не описывай диаграмму — она строится отдельно.
+- Никаких лишних фраз после аналитики.
+"""
+
+        topic_lines = []
+        for topic in topics:
+            topic_lines.append(f"Тема: {topic['name']} — {topic['count']} вопросов ({topic['percent']}%)")
+            for example in topic["examples"]:
+                line = f"  Вопрос: {example['question']}"
+                if example.get("answer"):
+                    line += f"\n  Ответ: {example['answer']}"
+                topic_lines.append(line)
+
+        user_content = (f"Текст выступления для анализа:\n\n{conf_text}\n\n"
+                        f"Статистика по темам вопросов участников:\n\n" + "\n".join(topic_lines))
+
+        messages = [
+            Messages(role=MessagesRole.SYSTEM, content=system_content),
+            Messages(role=MessagesRole.USER, content=user_content)
+        ]
+
+        response = self.client.chat(Chat(messages=messages))
+
+        summary, _ = self._parse_response(response.choices[0].message.content)
+        return summary
+
+    def build_chart_code(self, topics: list) -> str:
+        """
+        Код круговой диаграммы по локально посчитанным процентам тем
+        """
+        topics = [topic for topic in topics if topic["count"]]
+        if not topics:
+            return ""
+
+        labels = [topic["name"] for topic in topics]
+        sizes = [topic["percent"] for topic in topics]
+        use_legend = any(len(label) > 25 for label in labels)
+
+        lines = [
+            "import matplotlib",
+            "matplotlib.use('Agg')",
+            "import matplotlib.pyplot as plt",
+            "",
+            f"labels = {labels!r}",
+            f"sizes = {sizes!r}",
+            "",
+            "plt.figure(figsize=(10, 8))",
+        ]
+        if use_legend:
+            lines += [
+                "wedges, _, _ = plt.pie(sizes, autopct='%1.1f%%', startangle=90)",
+                "plt.legend(wedges, labels, loc='center left', bbox_to_anchor=(1, 0.5))",
+            ]
+        else:
+            lines.append("plt.pie(sizes, labels=labels, autopct='%1.1f%%', startangle=90)")
+        lines += [
+            "plt.axis('equal')",
+            'plt.title("Тематика вопросов участников", fontsize=14, pad=20)',
+            "plt.tight_layout()",
+            "plt.savefig(\"chart.png\", bbox_inches='tight', dpi=100)",
+        ]
+        return "\n".join(lines)
+
     def _parse_response(self, response: str) -> tuple:
         """
         Парсинг ответа от GC - ищем текст и код в ```python
@@ -219,6 +314,31 @@ import os
             if os.path.exists(temp_file):
                 os.unlink(temp_file)
 
+    def build_docx(self, summary: str, chart_created: bool, docx_path: str):
+        """
+        Формирование docx документа отчёта (потом конвертируется в PDF)
+        """
+        doc = Document()
+
+        doc.add_heading('Итоги конференции', 0)
+
+        doc.add_heading('Краткое содержание:', level=1)
+        for paragraph in summary.split('\n'):
+            if paragraph.strip():
+                if paragraph.strip().startswith('**') and paragraph.strip().endswith('**'):
+                    doc.add_heading(paragraph.strip('*').strip(), level=2)
+                else:
+                    doc.add_paragraph(paragraph)
+
+        if chart_created:
+            doc.add_heading('Визуализация:', level=1)
+            doc.add_picture('chart.png', width=Inches(6))
+        else:
+            doc.add_heading('Визуализация не создана', level=1)
+            doc.add_paragraph('Не удалось сгенерировать диаграмму по данным конференции.')
+
+        doc.save(docx_path)
+
     def create_report(self, docx_files: list, output_file: str = "итоги_конференции.pdf"):
         """
         Основной метод: создаёт полный отчёт с диаграммой формата .pdf .
@@ -231,12 +351,29 @@ import os
         # временный docx файл для конвертации
         temp_docx = output_file.replace('.pdf', '_temp.docx')
 
+        # вопросы (.txt) анализируем инкрементально, остальное - речь спикера
+        question_files = [path for path in docx_files if path.lower().endswith('.txt')]
+        lecture_files = [path for path in docx_files if path not in question_files]
+
         #print("1. Чтение файлов...")
-        conference_text = self.merge_texts(docx_files)
+        with metrics.timer("report_read"):
+            conference_text = self.merge_texts(lecture_files)
+            entries = []
+            for path in question_files:
+                if os.path.exists(path):
+                    entries.extend(read_questions(path))
         #print(f"    Прочитано {len(conference_text)} символов")
 
         #print("2. Отправка запроса в Gigachat...")
-        summary, code = self.get_summary_and_code(conference_text)
+        if question_files:
+            with metrics.timer("report_topics"):
+                topics = TopicAnalyzer(self.client).update(entries)
+            with metrics.timer("report_llm"):
+                summary = self.get_summary_with_topics(conference_text, topics)
+            code = self.build_chart_code(topics)
+        else:
+            with metrics.timer("report_llm"):
+                summary, code = self.get_summary_and_code(conference_text)
         #print("   ✓ Ответ получен и распарсен")
 
         #print("3. Создание диаграммы...")
@@ -244,33 +381,17 @@ import os
         #if code:
         #    print("Первые 100 символов кода:")
         #    print(code[:100])
-        chart_created = self.generate_chart(code)
+        with metrics.timer("report_chart"):
+            chart_created = self.generate_chart(code)
 
         #print("4. Формирование временного документа...")
-        doc = Document()
-
-        doc.add_heading('Итоги конференции', 0)
-
-        doc.add_heading('Краткое содержание:', level=1)
-        for paragraph in summary.split('\n'):
-            if paragraph.strip():
-                if paragraph.strip().startswith('**') and paragraph.strip().endswith('**'):
-                    doc.add_heading(paragraph.strip('*').strip(), level=2)
-                else:
-                    doc.add_paragraph(paragraph)
-
-        if chart_created:
-            doc.add_heading('Визуализация:', level=1)
-            doc.add_picture('chart.png', width=Inches(6))
-        else:
-            doc.add_heading('Визуализация не создана', level=1)
-            doc.add_paragraph('Не удалось сгенерировать диаграмму по данным конференции.')
-
-        doc.save(temp_docx)
+        with metrics.timer("report_docx"):
+            self.build_docx(summary, chart_created, temp_docx)
         #print(f"4. ✓ Готово! Временный отчёт сохранён в {temp_docx}")
 
         #print("5. Конвертация в PDF...")
-        convert(temp_docx, output_file)
+        with metrics.timer("report_pdf"):
+            convert(temp_docx, output_file)
         if os.path.exists(output_file):
             pdf_size = os.path.getsize(output_file)
             #print(f"   ✓ PDF успешно создан! Размер: {pdf_size} байт")
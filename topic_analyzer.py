@@ -0,0 +1,271 @@
+import os
+import re
+import json
+import hashlib
+import logging
+from pathlib import Path
+
+import numpy as np
+from gigachat.models import Chat, Messages, MessagesRole
+
+import config
+import question_clustering as qc
+
+
+logger = logging.getLogger(__name__)
+
+STATE_VERSION = 3
+MAX_EXAMPLES = 3          # Сколько примеров вопросов храним на тему
+CANDIDATE_EXAMPLES = 6    # Из скольких ближайших к центру вопросов GC выбирает примеры
+MIN_TOPIC_SIZE = 2        # Меньшие группы ждут новых вопросов в "отложенных"
+SIMILARITY_THRESHOLD = 0.25
+MAX_PENDING = 2000        # Сколько последних отложенных вопросов перекластеризуем, старые уходят в "Другие"
+OTHER_TOPIC_NAME = "Другие вопросы"
+
+_ANSWER_PREFIXES = ("ответ:", "о:", "a:", "answer:")
+_QUESTION_PREFIXES = ("вопрос:", "в:", "q:", "question:")
+
+
+# Читаем файл вопросов: одна строка - один вопрос, строка "Ответ: ..." относится к предыдущему
+def read_questions(path: str) -> list:
+    entries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+
+            lowered = line.lower()
+            if lowered.startswith(_ANSWER_PREFIXES) and entries:
+                answer = line.split(':', 1)[1].strip()
+                entries[-1]["answer"] = f"{entries[-1]['answer']} {answer}".strip()
+                continue
+
+            if lowered.startswith(_QUESTION_PREFIXES):
+                line = line.split(':', 1)[1].strip()
+            entries.append({"question": line, "answer": ""})
+    return entries
+
+
+def _fingerprint(entries: list, answers: bool = True) -> str:
+    digest = hashlib.sha256()
+    for entry in entries:
+        digest.update(entry["question"].encode("utf-8"))
+        if answers:
+            digest.update(b"\t")
+            digest.update(entry["answer"].encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+class TopicAnalyzer:
+    """
+    Инкрементальная аналитика вопросов: хранит темы между запусками
+    и классифицирует только вопросы, добавленные с прошлого отчёта
+    """
+
+    def __init__(self, client=None, state_path: str = None):
+        """
+        Args:
+            client: клиент GigaChat, нужен только для названий новых тем
+            state_path: путь к файлу состояния тем
+        """
+        self.client = client
+        self.state_path = Path(state_path or config.TOPIC_STATE_PATH)
+        self.state = self._load_state()
+
+    def _empty_state(self) -> dict:
+        return {"version": STATE_VERSION, "processed": 0, "fingerprint": _fingerprint([]),
+                "questions_fingerprint": _fingerprint([], answers=False),
+                "n_docs": 0, "df": [0] * qc.N_FEATURES, "topics": [], "pending": [], "expired": 0}
+
+    def _load_state(self) -> dict:
+        if not self.state_path.exists():
+            return self._empty_state()
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get("version") != STATE_VERSION:
+                return self._empty_state()
+            return state
+        except (OSError, ValueError) as e:
+            logger.warning(f"Не удалось прочитать состояние тем {self.state_path}: {e}")
+            return self._empty_state()
+
+    def _save_state(self):
+        tmp_path = self.state_path.with_suffix(self.state_path.suffix + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.state_path)
+
+    def update(self, entries: list) -> list:
+        """
+        Обновляет темы по новым вопросам и возвращает список тем с процентами
+
+        Args:
+            entries: все вопросы из файла (список словарей question/answer)
+        """
+        processed = self.state["processed"]
+        changed = False
+
+        # Файл переписали, а не дополнили - начинаем анализ заново
+        head = entries[:processed]
+        if processed > len(entries) or _fingerprint(head, answers=False) != self.state["questions_fingerprint"]:
+            logger.info("Файл вопросов изменился не только в конце - пересчитываем темы с нуля")
+            self.state = self._empty_state()
+            processed = 0
+        elif _fingerprint(head) != self.state["fingerprint"]:
+            # К уже разобранным вопросам дописали ответы - переносим их в примеры тем
+            self._refresh_answers(head)
+            changed = True
+
+        new_entries = entries[processed:]
+        if new_entries:
+            logger.info(f"Новых вопросов для классификации: {len(new_entries)}")
+            self._classify(new_entries)
+            changed = True
+
+        if changed:
+            self.state["processed"] = len(entries)
+            self.state["fingerprint"] = _fingerprint(entries)
+            self.state["questions_fingerprint"] = _fingerprint(entries, answers=False)
+            self._save_state()
+
+        return self.topics()
+
+    def _refresh_answers(self, entries: list):
+        answers = {entry["question"]: entry["answer"] for entry in entries}
+        examples = [example for topic in self.state["topics"] for example in topic["examples"]]
+        for example in examples + self.state["pending"]:
+            example["answer"] = answers.get(example["question"], example["answer"])
+
+    def _classify(self, new_entries: list):
+        topics = self.state["topics"]
+
+        # Частоты документов копим по всем вопросам, чтобы idf был стабилен между запусками
+        tf = qc.term_frequencies([entry["question"] for entry in new_entries])
+        df = np.asarray(self.state["df"], dtype=np.float64) + qc.document_frequencies(tf)
+        self.state["df"] = df.astype(int).tolist()
+        self.state["n_docs"] += len(new_entries)
+        idf = qc.idf_weights(df, self.state["n_docs"])
+
+        # Центр темы храним как сумму нормированных tf-векторов, idf применяем при сравнении
+        unit_tf = qc.normalize(tf)
+        # Работа за отчёт растёт с числом новых вопросов, а не со всей историей:
+        # давно отложенные вопросы больше не перебираем, они остаются в "Других вопросах"
+        unassigned = self.state["pending"][-MAX_PENDING:]
+        self.state["expired"] += len(self.state["pending"]) - len(unassigned)
+        if topics:
+            centroids = np.asarray([topic["centroid"] for topic in topics], dtype=np.float32)
+            similarity = qc.normalize(tf * idf) @ qc.normalize(centroids * idf).T
+            best = similarity.argmax(axis=1)
+            for i, entry in enumerate(new_entries):
+                if similarity[i, best[i]] >= SIMILARITY_THRESHOLD:
+                    self._add_to_topic(topics[best[i]], entry, unit_tf[i])
+                else:
+                    unassigned.append(entry)
+        else:
+            unassigned.extend(new_entries)
+
+        if not unassigned:
+            self.state["pending"] = []
+            return
+
+        # Из неразобранных вопросов собираем кластеры-кандидаты в новые темы
+        un_tf = qc.term_frequencies([entry["question"] for entry in unassigned])
+        X = qc.normalize(un_tf * idf)
+        k = qc.choose_k(X)
+        labels, cluster_centroids = qc.kmeans(X, k)
+        un_unit_tf = qc.normalize(un_tf)
+
+        new_topics, pending = [], []
+        for cluster in range(k):
+            members = np.flatnonzero(labels == cluster)
+            if len(members) < MIN_TOPIC_SIZE:
+                pending.extend(unassigned[i] for i in members)
+                continue
+
+            candidates = qc.representatives(X, labels, cluster_centroids, cluster, CANDIDATE_EXAMPLES)
+            new_topics.append({
+                "name": "",
+                "count": int(len(members)),
+                "examples": [unassigned[i] for i in candidates],
+                "centroid": un_unit_tf[members].sum(axis=0).tolist(),
+            })
+
+        self.state["pending"] = pending
+        if new_topics:
+            self._name_topics(new_topics)
+            topics.extend(new_topics)
+
+    def _add_to_topic(self, topic: dict, entry: dict, unit_tf: np.ndarray):
+        topic["count"] += 1
+        topic["centroid"] = (np.asarray(topic["centroid"], dtype=np.float32) + unit_tf).tolist()
+        if len(topic["examples"]) < MAX_EXAMPLES:
+            topic["examples"].append(entry)
+
+    def _fallback_name(self, topic: dict) -> str:
+        return topic["examples"][0]["question"][:60] if topic["examples"] else "Без названия"
+
+    def _name_topics(self, topics: list):
+        """
+        Один запрос к GC на все новые темы: название темы и выбор показательных примеров.
+        Количество и проценты GC не считает - они известны из кластеризации.
+        """
+        names = [self._fallback_name(topic) for topic in topics]
+        picks = [list(range(min(MAX_EXAMPLES, len(topic["examples"])))) for topic in topics]
+
+        if self.client is not None:
+            groups_text = []
+            for i, topic in enumerate(topics, 1):
+                examples = "\n".join(f"{j}) {example['question']}"
+                                     for j, example in enumerate(topic["examples"], 1))
+                groups_text.append(f"Группа {i}:\n{examples}")
+
+            messages = [
+                Messages(role=MessagesRole.SYSTEM, content=(
+                    "Ты помогаешь анализировать вопросы слушателей конференции. "
+                    "Для каждой группы вопросов придумай короткое название темы (2-5 слов) "
+                    f"и выбери до {MAX_EXAMPLES} самых показательных вопросов группы. "
+                    "Ответь строго в формате: одна строка на группу, "
+                    "\"<номер группы>. <название> | <номера вопросов через запятую>\", без пояснений."
+                )),
+                Messages(role=MessagesRole.USER, content="\n\n".join(groups_text)),
+            ]
+
+            try:
+                response = self.client.chat(Chat(messages=messages))
+                for line in response.choices[0].message.content.splitlines():
+                    match = re.match(r'\s*(\d+)[.)]\s*([^|]+)(?:\|(.*))?', line)
+                    if not match or not 1 <= int(match.group(1)) <= len(topics):
+                        continue
+                    i = int(match.group(1)) - 1
+                    names[i] = match.group(2).strip().strip('*"«»')
+                    chosen = [int(n) - 1 for n in re.findall(r'\d+', match.group(3) or "")]
+                    chosen = [n for n in dict.fromkeys(chosen) if 0 <= n < len(topics[i]["examples"])]
+                    if chosen:
+                        picks[i] = chosen[:MAX_EXAMPLES]
+            except Exception as e:
+                logger.error(f"Не удалось получить названия тем от GigaChat: {e}")
+
+        for topic, name, chosen in zip(topics, names, picks):
+            topic["name"] = name
+            topic["examples"] = [topic["examples"][j] for j in chosen]
+
+    def topics(self) -> list:
+        """
+        Текущие темы по убыванию популярности с точными процентами
+        """
+        topics = [{"name": topic["name"], "count": topic["count"], "examples": topic["examples"]}
+                  for topic in self.state["topics"]]
+        topics.sort(key=lambda topic: topic["count"], reverse=True)
+
+        pending = self.state["pending"]
+        other = len(pending) + self.state["expired"]
+        if other:
+            topics.append({"name": OTHER_TOPIC_NAME, "count": other,
+                           "examples": pending[:MAX_EXAMPLES]})
+
+        for topic, percent in zip(topics, qc.percentages([topic["count"] for topic in topics])):
+            topic["percent"] = percent
+        return topics
@@ -0,0 +1,216 @@
+import re
+import time
+import sqlite3
+import logging
+import threading
+
+import config
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+# Режимы ответа в зависимости от расхода за сутки
+NORMAL = "normal"
+ECONOMY = "economy"
+EXHAUSTED = "exhausted"
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+MESSAGE_OVERHEAD = 3     # служебные токены роли и разделителей на сообщение
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    day TEXT NOT NULL,
+    chat_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    command TEXT NOT NULL,
+    calls INTEGER NOT NULL,
+    prompt_tokens INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL,
+    estimated_tokens INTEGER NOT NULL,
+    PRIMARY KEY (day, chat_id, user_id, command)
+);
+CREATE INDEX IF NOT EXISTS usage_day_user ON usage (day, user_id);
+"""
+
+
+# Локальная оценка числа токенов: слово - токен на каждые ~4 символа, знак препинания - токен
+def count_tokens(text: str) -> int:
+    return sum(1 + (len(token) - 1) // 4 for token in _TOKEN_PATTERN.findall(text or ""))
+
+
+class UsageTracker:
+    """
+    Учёт токенов GigaChat по чатам, пользователям и командам с суточными квотами.
+    Каждая запись сразу сохраняется в SQLite, а расход для квот читается оттуда же,
+    поэтому квоты переживают перезапуск бота и общие для всех процессов кластера.
+    """
+
+    def __init__(self, path: str, user_quota: int, chat_quota: int, economy_share: float):
+        """
+        Args:
+            path: путь к файлу базы
+            user_quota: токенов в сутки на пользователя (0 - без ограничения)
+            chat_quota: токенов в сутки на чат (0 - без ограничения)
+            economy_share: с какой доли квоты переходить в экономный режим
+        """
+        self.user_quota = user_quota
+        self.chat_quota = chat_quota
+        self.economy_share = economy_share
+
+        # Поправка локальной оценки по фактическим prompt_tokens из ответов
+        self.calibration = 1.0
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(_SCHEMA)
+
+    @staticmethod
+    def _today() -> str:
+        return time.strftime("%Y-%m-%d")
+
+    # Токенов за сутки по условию на столбец (chat_id или user_id)
+    def _spent(self, column: str, value: int) -> int:
+        row = self._connection.execute(
+            f"SELECT COALESCE(SUM(prompt_tokens + completion_tokens), 0) FROM usage "
+            f"WHERE day = ? AND {column} = ?", (self._today(), value)
+        ).fetchone()
+        return row[0]
+
+    def estimate(self, messages: list) -> int:
+        """
+        Оценка токенов промпта до отправки (messages - объекты Messages или словари)
+        """
+        raw = 0
+        for message in messages:
+            content = message["content"] if isinstance(message, dict) else message.content
+            raw += count_tokens(content) + MESSAGE_OVERHEAD
+        return int(raw * self.calibration)
+
+    def mode(self, chat_id: int, user_id: int, estimated: int = 0) -> str:
+        """
+        Режим для следующего запроса с учётом уже потраченного и оценки запроса
+        """
+        shares = []
+        with self._lock:
+            try:
+                if self.user_quota and user_id:
+                    shares.append((self._spent("user_id", user_id) + estimated) / self.user_quota)
+                if self.chat_quota:
+                    shares.append((self._spent("chat_id", chat_id) + estimated) / self.chat_quota)
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка чтения расхода токенов: {e}")
+
+        share = max(shares, default=0.0)
+        if share >= 1:
+            return EXHAUSTED
+        if share >= self.economy_share:
+            return ECONOMY
+        return NORMAL
+
+    def record(self, chat_id: int, user_id: int, command: str, usage, estimated: int = 0):
+        """
+        Записать usage из ответа GigaChat (response.usage)
+        """
+        if usage is None:
+            return
+        prompt, completion = usage.prompt_tokens, usage.completion_tokens
+
+        with self._lock:
+            if estimated and prompt:
+                # Скользящая поправка: оценка постепенно подстраивается под токенизатор GigaChat
+                self.calibration = 0.9 * self.calibration + 0.1 * self.calibration * prompt / estimated
+
+            try:
+                with self._connection:
+                    self._connection.execute(
+                        "INSERT INTO usage VALUES (?, ?, ?, ?, 1, ?, ?, ?) "
+                        "ON CONFLICT (day, chat_id, user_id, command) DO UPDATE SET "
+                        "calls = calls + 1, prompt_tokens = prompt_tokens + excluded.prompt_tokens, "
+                        "completion_tokens = completion_tokens + excluded.completion_tokens, "
+                        "estimated_tokens = estimated_tokens + excluded.estimated_tokens",
+                        (self._today(), chat_id, user_id, command, prompt, completion, estimated),
+                    )
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка записи расхода токенов: {e}")
+
+        metrics.inc("llm_tokens_total", prompt, kind="prompt", command=command)
+        metrics.inc("llm_tokens_total", completion, kind="completion", command=command)
+
+    def totals(self) -> dict:
+        """
+        Расход за текущие сутки (всех процессов): по командам, топ чатов и пользователей
+        """
+        day = self._today()
+        with self._lock:
+            commands = self._connection.execute(
+                "SELECT command, SUM(calls), SUM(prompt_tokens), SUM(completion_tokens) FROM usage "
+                "WHERE day = ? GROUP BY command", (day,)
+            ).fetchall()
+            chats, users = (self._connection.execute(
+                f"SELECT {column}, SUM(prompt_tokens + completion_tokens) AS tokens FROM usage "
+                f"WHERE day = ? GROUP BY {column} ORDER BY tokens DESC LIMIT 10", (day,)
+            ).fetchall() for column in ("chat_id", "user_id"))
+        return {
+            "day": day,
+            "commands": {command: {"calls": calls, "prompt": prompt, "completion": completion}
+                         for command, calls, prompt, completion in commands},
+            "chats": chats,
+            "users": users,
+        }
+
+    def format_usage(self) -> str:
+        totals = self.totals()
+        if not totals["commands"]:
+            return f"За {totals['day']} запросов к GigaChat не было"
+
+        lines = [f"Расход токенов за {totals['day']}:"]
+        for command, item in sorted(totals["commands"].items()):
+            lines.append(f"{command}: {item['calls']} запросов, вход {item['prompt']}, ответ {item['completion']}")
+
+        lines.append("\nЧаты:")
+        for chat_id, tokens in totals["chats"]:
+            limit = f" из {self.chat_quota}" if self.chat_quota else ""
+            lines.append(f"{chat_id}: {tokens}{limit}")
+        lines.append("\nПользователи:")
+        for user_id, tokens in totals["users"]:
+            limit = f" из {self.user_quota}" if self.user_quota and user_id else ""
+            lines.append(f"{user_id}: {tokens}{limit}")
+        return "\n".join(lines)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class MeteredClient:
+    """
+    Обёртка клиента GigaChat, которая записывает расход токенов каждого chat()
+    """
+
+    def __init__(self, client, tracker: UsageTracker, command: str, chat_id: int = 0, user_id: int = 0):
+        self.client = client
+        self.tracker = tracker
+        self.command = command
+        self.chat_id = chat_id
+        self.user_id = user_id
+
+    def chat(self, payload, **kwargs):
+        messages = payload.messages if hasattr(payload, "messages") else payload.get("messages", [])
+        estimated = self.tracker.estimate(messages)
+        response = self.client.chat(payload, **kwargs)
+        self.tracker.record(self.chat_id, self.user_id, self.command, response.usage, estimated)
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+tracker = UsageTracker(
+    config.USAGE_DB_PATH,
+    user_quota=config.USER_DAILY_TOKEN_QUOTA,
+    chat_quota=config.CHAT_DAILY_TOKEN_QUOTA,
+    economy_share=config.ECONOMY_THRESHOLD,
+)
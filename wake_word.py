@@ -0,0 +1,160 @@
+import re
+from typing import NamedTuple, Optional
+
+
+# Обращения к боту по умолчанию
+DEFAULT_NAMES = [
+    "Гигачат", "гигачат", "Гига", "гига",
+    "Gigachat", "gigachat", "Giga", "giga",
+    "ассистент"]
+
+MIN_FUZZY_LENGTH = 5   # Короткие имена ("гига") сравниваем только точно
+MAX_PREFIX_WORDS = 2   # "Giga chat", "Гига чат" - обращение из двух слов
+
+_NON_WORD_RE = re.compile(r"[\W_]+")
+_PREFIX_PUNCTUATION = " \t\n,.!?;:-—–"
+_LEADING = _PREFIX_PUNCTUATION + "@"   # Что может стоять перед обращением
+
+
+class WakeWordMatch(NamedTuple):
+    name: str       # Нормализованное имя, с которым совпало обращение
+    end: int        # Позиция в исходном тексте, где закончилось обращение
+    question: str   # Текст после обращения
+    fuzzy: bool     # Совпадение найдено по расстоянию Левенштейна
+
+
+def normalize(word: str) -> str:
+    return _NON_WORD_RE.sub("", word.casefold().replace('ё', 'е'))
+
+
+def _max_distance(length: int) -> int:
+    return 1 if length <= 7 else 2
+
+
+# Расстояние Левенштейна с отсечением: как только оно заведомо больше limit, возвращаем limit + 1
+def bounded_levenshtein(a: str, b: str, limit: int) -> int:
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if len(a) > len(b):
+        a, b = b, a
+
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        row_min = i
+        for j, char_b in enumerate(b, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b))
+            row_min = min(row_min, current[j])
+        if row_min > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class WakeWordMatcher:
+    """
+    Поиск обращения к боту в начале сообщения. Имена нормализуются один раз при создании,
+    для распознанной речи дополнительно есть нечёткое сравнение ("Гигачад" -> "гигачат")
+    """
+
+    def __init__(self, names: list):
+        self.names = frozenset(filter(None, (normalize(name) for name in names)))
+        # Первые буквы имён в обоих регистрах: обычное сообщение отсекается одной проверкой символа
+        self._first_chars = set()
+        # Первые две буквы имён: сообщение, которое начинается с двух букв, проверяется по ним
+        self._heads = {name[:2] for name in self.names}
+        # Начала более длинных имён: только после них имеет смысл смотреть на следующее слово
+        self._prefixes = set()
+        for name in self.names:
+            first = name[0]
+            self._first_chars.update((first, first.upper()))
+            if first == 'е':
+                self._first_chars.update(('ё', 'Ё'))
+            self._prefixes.update(name[:i] for i in range(1, len(name)))
+        # Для нечёткого поиска группируем имена по длине, чтобы сразу отбрасывать неподходящие
+        self._by_length = {}
+        for name in self.names:
+            if len(name) >= MIN_FUZZY_LENGTH:
+                self._by_length.setdefault(len(name), []).append(name)
+        # Кэш нормализации первых слов: начала сообщений сильно повторяются
+        self._normalized = {}
+
+    def _normalize(self, word: str) -> str:
+        normalized = self._normalized.get(word)
+        if normalized is None:
+            normalized = normalize(word)
+            if len(self._normalized) < 10000:
+                self._normalized[word] = normalized
+        return normalized
+
+    def _fuzzy_lookup(self, word: str) -> Optional[str]:
+        if len(word) < MIN_FUZZY_LENGTH - 1:
+            return None
+        limit = _max_distance(len(word))
+        best, best_distance = None, limit + 1
+        for length in range(len(word) - limit, len(word) + limit + 1):
+            for name in self._by_length.get(length, ()):
+                # Имя с окончанием ("Гигачату", "Ассистенты") - другое слово, а не ошибка распознавания
+                if word.startswith(name):
+                    continue
+                name_limit = min(limit, _max_distance(len(name)))
+                distance = bounded_levenshtein(word, name, name_limit)
+                if distance <= name_limit and distance < best_distance:
+                    best, best_distance = name, distance
+        return best
+
+    def match(self, text: str, fuzzy: bool = False) -> Optional[WakeWordMatch]:
+        """
+        Ищет обращение в начале текста
+
+        Args:
+            text: текст сообщения, подписи или распознанной речи
+            fuzzy: разрешить нечёткое совпадение (для текста из STT)
+        """
+        if not text:
+            return None
+
+        # Быстрый путь для обычной переписки: ни одно имя не начинается с первой буквы сообщения
+        start = 0
+        if not text[0].isalnum():
+            # Пропускаем пробелы и знаки перед обращением: слова ниже начинаются ровно со start
+            start = len(text) - len(text.lstrip(_LEADING).lstrip())
+        if not fuzzy:
+            pair = text[start:start + 2]
+            if pair.isalpha():
+                # У двух букв подряд normalize меняет только регистр и ё
+                if pair.casefold().replace('ё', 'е') not in self._heads:
+                    return None
+            elif pair[:1] not in self._first_chars:
+                return None
+
+        # Берём только первые слова, а не разбиваем всё сообщение
+        words = text[start:].split(None, MAX_PREFIX_WORDS)
+        if not words:
+            return None
+
+        # Ключи для одного слова и для двух слитно ("Giga chat" -> "gigachat") с концом в тексте.
+        # Нормализация одна и та же для точного и нечёткого поиска
+        key = self._normalize(words[0])
+        end = start + len(words[0])
+        candidates = [(key, end)]
+        # Второе слово нужно, только если с первого начинается более длинное имя (или для нечёткого поиска)
+        if len(words) > 1 and (fuzzy or key in self._prefixes):
+            end = text.index(words[1], end) + len(words[1])
+            candidates.append((key + self._normalize(words[1]), end))
+
+        # Предпочитаем самое длинное точное совпадение
+        for key, end in reversed(candidates):
+            if key in self.names:
+                return self._build(text, key, end, False)
+
+        if fuzzy:
+            for key, end in reversed(candidates):
+                name = self._fuzzy_lookup(key)
+                if name:
+                    return self._build(text, name, end, True)
+
+        return None
+
+    def _build(self, text: str, name: str, end: int, fuzzy: bool) -> WakeWordMatch:
+        return WakeWordMatch(name, end, text[end:].lstrip(_PREFIX_PUNCTUATION).rstrip(), fuzzy)
@@ -0,0 +1,125 @@
+import asyncio
+import hmac
+import logging
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+import config
+
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+# Определяем чат обновления, чтобы сообщения одного чата обрабатывались по порядку
+def shard_key(update: Update) -> int:
+    event = update.event
+    chat = getattr(event, "chat", None)
+    if chat is None and getattr(event, "message", None) is not None:
+        chat = event.message.chat
+    if chat is not None:
+        return chat.id
+    return update.update_id
+
+
+class WebhookIngress:
+    """
+    Приём обновлений по webhook: проверка секрета, быстрый ответ Telegram
+    и обработка обновлений пулом воркеров (один чат - один воркер)
+    """
+
+    def __init__(self, bot: Bot, dp: Dispatcher, secret: str, workers: int, queue_size: int):
+        self.bot = bot
+        self.dp = dp
+        self.secret = secret
+        self.queues = [asyncio.Queue(maxsize=queue_size) for _ in range(max(1, workers))]
+        self._tasks = []
+
+    def start(self):
+        for i, queue in enumerate(self.queues):
+            self._tasks.append(asyncio.create_task(self._worker(i, queue)))
+        logger.info(f"Запущено воркеров обработки обновлений: {len(self.queues)}")
+
+    async def stop(self):
+        # Дожидаемся обработки уже принятых обновлений
+        for queue in self.queues:
+            await queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self.secret:
+            token = request.headers.get(SECRET_HEADER, "")
+            if not hmac.compare_digest(token, self.secret):
+                logger.warning(f"Webhook: неверный секрет от {request.remote}")
+                return web.Response(status=401)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except Exception as e:
+            logger.warning(f"Webhook: не удалось разобрать обновление: {e}")
+            return web.Response(status=400)
+
+        # Отвечаем Telegram сразу, обработка идёт в воркере
+        await self.enqueue(update)
+        return web.Response()
+
+    async def enqueue(self, update: Update):
+        queue = self.queues[shard_key(update) % len(self.queues)]
+        await queue.put(update)
+
+    def pending(self) -> int:
+        return sum(queue.qsize() for queue in self.queues)
+
+    async def _worker(self, index: int, queue: asyncio.Queue):
+        while True:
+            update = await queue.get()
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception as e:
+                logger.error(f"Воркер {index}: ошибка при обработке обновления {update.update_id}: {e}")
+            finally:
+                queue.task_done()
+
+
+# Запуск бота в режиме webhook со встроенным aiohttp сервером
+async def run_webhook(bot: Bot, dp: Dispatcher, allowed_updates: list = None):
+    ingress = WebhookIngress(
+        bot, dp,
+        secret=config.WEBHOOK_SECRET,
+        workers=config.WEBHOOK_WORKERS,
+        queue_size=config.WEBHOOK_QUEUE_SIZE,
+    )
+
+    app = web.Application()
+    app.router.add_post(config.WEBHOOK_PATH, ingress.handle)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, config.WEBHOOK_HOST, config.WEBHOOK_PORT)
+
+    ingress.start()
+    await site.start()
+    logger.info(f"Webhook сервер слушает {config.WEBHOOK_HOST}:{config.WEBHOOK_PORT}{config.WEBHOOK_PATH}")
+
+    # Без внешнего адреса работаем локально (например, для нагрузочного теста через replay_updates.py)
+    if config.WEBHOOK_BASE_URL:
+        await bot.set_webhook(
+            url=config.WEBHOOK_BASE_URL.rstrip('/') + config.WEBHOOK_PATH,
+            secret_token=config.WEBHOOK_SECRET or None,
+            allowed_updates=allowed_updates if allowed_updates is not None else dp.resolve_used_update_types(),
+            drop_pending_updates=True,
+        )
+        logger.info("Webhook зарегистрирован в Telegram")
+    else:
+        logger.info("WEBHOOK_BASE_URL не задан - webhook в Telegram не регистрируется")
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        await ingress.stop()